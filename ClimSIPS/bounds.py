@@ -0,0 +1,75 @@
+#################################
+# packages
+#################################
+
+import numpy as np
+from scipy.optimize import milp, Bounds
+
+from . import solvers as css
+
+##################################################################
+# lower bounds on the minimum subset cost
+##################################################################
+
+# Every bound holds for all subsets S of size m of the cost matrix of get_best_m_models,
+#   min_S sum_{i,j in S} cost[i, j] >= bound,
+# so a subset found by a heuristic solver is at most its cost minus the bound above the optimum
+# (its gap), and a gap of 0 proves it optimal. Member constraints only remove subsets, the bounds
+# of the unconstrained problem remain valid (and are weaker).
+
+# bounds of lower_bound by default (the spectral one is dominated by 'lp' on the bundled files)
+BOUND_METHODS = ('root', 'lp')
+
+# the root bound of solvers.branch_and_bound: every member i of S adds cost[i, i] and half of its
+# m-1 pair terms, at least half the sum of its m-1 smallest ones; the m smallest of these sums.
+# Exact when the pair terms do not matter (e.g. alpha = beta = 0)
+def root_bound(cost, m):
+    pair = cost + cost.T
+    np.fill_diagonal(pair, np.inf)
+    pair.sort(axis=1)
+    own = np.diag(cost) + 0.5*pair[:, :m-1].sum(axis=1)
+    return np.sort(own)[:m].sum()
+
+# eigenvalue bound: with Q = (cost + cost.T)/2 and x = m/n + y (y orthogonal to the ones vector),
+#   x^T Q x = t^2 1^T Q 1 + 2 t (Q 1)^T y + y^T Q y,   t = m/n,   |y|^2 = m - m^2/n,
+# the linear term is smallest for the m smallest entries of Q 1 and y^T Q y >= mu |y|^2 with mu
+# the smallest eigenvalue of Q on the complement of the ones vector
+def spectral_bound(cost, m):
+    n = len(cost)
+    q = 0.5*(cost + cost.T)
+    projection = np.eye(n) - 1./n
+    values, vectors = np.linalg.eigh(projection @ q @ projection)
+    # the ones vector itself has eigenvalue 0 in the projected matrix
+    mu = np.delete(values, np.argmax(np.abs(vectors.sum(axis=0)))).min()
+    row = q.sum(axis=1)
+    t = m / n
+    return t*t*q.sum() - 2*t*t*row.sum() + np.sort(2*t*row)[:m].sum() + mu*(m - m*m/n)
+
+# linear programming relaxation of the linearized program of solvers.milp_subsets
+# (x and y continuous in [0, 1])
+def lp_bound(cost, m):
+    objective, constraints, integrality = css.milp_model(cost, m)
+    res = milp(objective, constraints=constraints, bounds=Bounds(0, 1))
+    if res.x is None:
+        return -np.inf
+    return res.fun
+
+# the largest bound of the given methods ('root', 'spectral', 'lp')
+def lower_bound(cost, m, methods=BOUND_METHODS):
+    cost = np.ascontiguousarray(cost, dtype=np.float64)
+    if m > len(cost):
+        return np.inf
+    bound_functions = dict(root=root_bound, spectral=spectral_bound, lp=lp_bound)
+    return max(bound_functions[method](cost, m) for method in methods)
+
+# lower bound on the minimum cost and gap, by how much the cost val of a found subset may exceed
+# the minimum; exact solvers found the minimum itself (bound val, gap 0), and gaps within the
+# rounding slack of the solvers are 0
+def certificate(cost, m, val, exact=False, methods=BOUND_METHODS):
+    if exact:
+        return dict(bound=float(val), gap=0.)
+    bound = lower_bound(cost, m, methods)
+    gap = max(0., val - bound)
+    if gap <= css.SLACK * css.cost_scale(cost, m):
+        gap = 0.
+    return dict(bound=float(bound), gap=float(gap))
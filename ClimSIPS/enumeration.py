@@ -0,0 +1,552 @@
+#################################
+# packages
+#################################
+
+import numpy as np
+
+import itertools
+import math
+import time
+import os
+import hashlib
+from pathlib import Path
+from functools import lru_cache
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+##################################################################
+# batched enumeration of member combinations
+##################################################################
+
+# number of cost matrix entries gathered per block; bounds the memory footprint
+# of one block to BLOCK_ELEMENTS float64 values regardless of n choose m
+BLOCK_ELEMENTS = 2**22
+
+# rows per block so that a block of m-subsets gathers about BLOCK_ELEMENTS entries
+def block_rows(m, block_elements=BLOCK_ELEMENTS):
+    return max(1, block_elements // max(1, m*m))
+
+# relative size of the rounding differences between incrementally (or otherwise) and exactly summed
+# costs of a subset; SLACK * cost_scale(cost, m) bounds them for the m x m entries of a cost matrix
+SLACK = 1e-9
+
+def cost_scale(cost, m):
+    return m*m*max(np.abs(cost).max(initial=0), 1.)
+
+# total number of combinations (n choose m)
+def combination_count(n, m):
+    return math.comb(n, m)
+
+# position of a sorted combination in the lexicographic order of all n choose m combinations
+def combination_rank(combo, n):
+    m = len(combo)
+    return math.comb(n, m) - 1 - sum(math.comb(n-1-c, m-i) for i, c in enumerate(combo))
+
+# combination_rank of the rows of combos as an array, of Python ints (dtype object) where
+# n choose m exceeds int64 (e.g. for the heuristic solvers on large pools)
+def combination_rank_array(combos, n):
+    ranks = [combination_rank(combo, n) for combo in combos]
+    return np.array(ranks, dtype=np.int64 if math.comb(n, np.shape(combos)[1]) <= np.iinfo(np.int64).max else object)
+
+# vectorized combination_rank of the rows of combos
+def combination_ranks(combos, n):
+    nrow, m = combos.shape
+    binom = np.array([[math.comb(a, b) for b in range(m+1)] for a in range(n)], dtype=np.int64)
+    ranks = np.full(nrow, math.comb(n, m) - 1, dtype=np.int64)
+    for i in range(m):
+        ranks -= binom[n-1-combos[:, i], m-i]
+    return ranks
+
+# combinations of the given lexicographic ranks (inverse of combination_ranks), shape (len(ranks), m)
+def combination_unranks(ranks, n, m):
+    # the complement rank sum_i C(n-1-c_i, m-i) is decoded greedily, largest binomial first
+    rest = math.comb(n, m) - 1 - np.asarray(ranks, dtype=np.int64)
+    combos = np.empty((len(rest), m), dtype=np.intp)
+    for i in range(m):
+        binom = np.array([math.comb(d, m-i) for d in range(n)], dtype=np.int64)
+        d = np.searchsorted(binom, rest, side='right') - 1
+        rest = rest - binom[d]
+        combos[:, i] = n-1-d
+    return combos
+
+# combination of the given lexicographic rank (inverse of combination_rank)
+def combination_unrank(rank, n, m):
+    return [int(c) for c in combination_unranks([rank], n, m)[0]]
+
+# splits the ranks 0 ... n choose m - 1 into contiguous (first, last) ranges of (almost) equal size
+def rank_shards(n, m, shards):
+    total = combination_count(n, m)
+    bounds = [total * i // shards for i in range(shards+1)]
+    return [(first, last) for first, last in zip(bounds[:-1], bounds[1:]) if last > first]
+
+# yields (first rank, combinations) blocks in lexicographic (itertools) order,
+# each block is an integer array of shape (rows, m);
+# with first and last only the combinations of ranks first ... last-1
+def combination_blocks(n, m, rows=None, first=0, last=None):
+    if rows is None:
+        rows = block_rows(m)
+    if first != 0 or last is not None:
+        if last is None:
+            last = combination_count(n, m)
+        for start in range(first, last, rows):
+            yield start, combination_unranks(np.arange(start, min(start+rows, last), dtype=np.int64), n, m)
+        return
+    combos = itertools.combinations(range(n), m)
+    start = 0
+    while True:
+        block = np.fromiter(itertools.chain.from_iterable(itertools.islice(combos, rows)), dtype=np.intp)
+        if block.size == 0:
+            return
+        block = block.reshape(-1, m)
+        yield start, block
+        start += len(block)
+
+################################
+# constrained enumeration
+################################
+
+# families: family label (int) of every member, or None; max_per_family: at most this many members
+# of one family in a subset, or None; include / exclude: members (indices) every subset contains / lacks
+Constraints = namedtuple('Constraints', ['families', 'max_per_family', 'include', 'exclude'])
+
+# members that can still be chosen besides include, their family labels (a label per member without
+# families) and the remaining capacity of every family
+def _constraint_pool(constraints, n):
+    include = sorted(set(constraints.include))
+    pool = np.array([i for i in range(n) if i not in include and i not in set(constraints.exclude)], dtype=np.intp)
+    families = np.arange(n) if constraints.families is None else np.asarray(constraints.families)
+    labels, family = np.unique(families, return_inverse=True)
+    cap = len(include) + n if constraints.max_per_family is None else constraints.max_per_family
+    capacity = np.full(len(labels), cap, dtype=np.int64)
+    np.subtract.at(capacity, family[include], 1)
+    return include, pool, family[pool], capacity
+
+# number of subsets of size m satisfying the constraints
+def constrained_count(constraints, n, m):
+    include, pool, family, capacity = _constraint_pool(constraints, n)
+    if (capacity < 0).any() or len(include) > m:
+        return 0
+    # product over the families of sum_j C(available, j) x^j, j <= capacity
+    counts = np.zeros(1, dtype=object)
+    counts[0] = 1
+    for f, available in zip(*np.unique(family, return_counts=True)):
+        factor = np.array([math.comb(int(available), j) for j in range(min(available, capacity[f])+1)], dtype=object)
+        counts = np.convolve(counts, factor)
+    r = m - len(include)
+    return int(counts[r]) if r < len(counts) else 0
+
+# yields (ranks, combinations) blocks of all subsets of size m satisfying the constraints, ranks in the
+# lexicographic order of all n choose m combinations (blocks are not in rank order). Partial subsets
+# are extended in increasing member order, only by members whose family has capacity left and only
+# while the remaining members can still complete the subset, so no infeasible subset is generated.
+def constrained_combination_blocks(constraints, n, m, rows=None):
+    if rows is None:
+        rows = block_rows(m)
+    include, pool, family, capacity = _constraint_pool(constraints, n)
+    r = m - len(include)
+    if (capacity < 0).any() or r < 0 or r > len(pool):
+        return
+    npool, nfam = len(pool), len(capacity)
+    # members of every family after position j of the pool
+    after = np.zeros((npool+1, nfam), dtype=np.int64)
+    for j in range(npool-1, -1, -1):
+        after[j] = after[j+1]
+        after[j, family[j]] += 1
+
+    def completable(last, counts, missing):
+        room = np.minimum(capacity[None, :] - counts, after[last+1]).sum(axis=1)
+        return room >= missing
+
+    # depth-first stack of (partial subsets as pool positions, family counts)
+    stack = [(np.empty((1, 0), dtype=np.intp), np.zeros((1, nfam), dtype=np.int64))]
+    while stack:
+        partial, counts = stack.pop()
+        depth = partial.shape[1]
+        if depth == r:
+            combos = np.hstack([pool[partial], np.broadcast_to(np.array(include, dtype=np.intp), (len(partial), len(include)))])
+            combos = np.ascontiguousarray(np.sort(combos, axis=1))
+            yield combination_ranks(combos, n), combos
+            continue
+        # bounded expansion: at most rows new partial subsets at once, the rest waits on the stack
+        chunk = max(1, rows // max(1, npool))
+        if len(partial) > chunk:
+            stack.append((partial[chunk:], counts[chunk:]))
+            partial, counts = partial[:chunk], counts[:chunk]
+        last = partial[:, -1] if depth else np.full(len(partial), -1)
+        valid = (np.arange(npool)[None, :] > last[:, None]) & (counts[:, family] < capacity[family][None, :])
+        row, col = np.nonzero(valid)
+        new_counts = counts[row]
+        new_counts[np.arange(len(row)), family[col]] += 1
+        keep = completable(col, new_counts, r - depth - 1)
+        if keep.any():
+            stack.append((np.hstack([partial[row[keep]], col[keep, None]]), new_counts[keep]))
+
+# cost of each subset: sum over the m x m sub-matrix of the cost matrix
+# (same reduction order as cost_matrix.isel(member=combo, member_model=combo).sum())
+def score_combinations(cost, combos):
+    # the gathered sub-matrices follow the memory layout of combos and the reduction order
+    # follows that layout, so it has to be C-ordered for reproducible sums
+    combos = np.ascontiguousarray(combos)
+    nrow, m = combos.shape
+    return cost[combos[:, :, None], combos[:, None, :]].reshape(nrow, m*m).sum(axis=1)
+
+# precisions of the subset scoring: 'float32' scores every subset approximately from a float32
+# matrix of the pair sums (half the entries of score_combinations, each half the bytes, with int32
+# indices), keeps every candidate within float32_slack of the selection and re-scores them in
+# float64, so the selection is the same as with 'float64'
+PRECISIONS = ['float64', 'float32']
+
+# bound on twice the rounding difference of a float32 subset sum (at most m*m entries rounded to
+# float32 and summed in float32 in any order) from the float64 sum: (m*m+1) * eps/2 * m*m*max|cost|
+# each; a subset among the exact selection is then within this of the float32 selection
+def float32_slack(cost, m):
+    return (m*m+1) * float(np.finfo(np.float32).eps) * m*m * max(np.abs(cost).max(), 1.)
+
+# cost[i, i] on the diagonal and cost[i, j] + cost[j, i] above it, as float32
+def pair_sums32(cost):
+    upper = np.triu(cost + cost.T, k=1)
+    upper[np.diag_indices_from(upper)] = np.diag(cost)
+    return upper.astype(np.float32)
+
+# approximate cost of each subset from pair_sums32 (any summation order)
+def score_combinations32(upper, combos):
+    combos = combos.astype(np.int32)
+    iu, ju = np.triu_indices(combos.shape[1])
+    return upper.ravel()[combos[:, iu] * np.int32(len(upper)) + combos[:, ju]].sum(axis=1)
+
+# scoring function of the combinations in the given precision and the slack of its selection
+def subset_scorer(cost, m, precision='float64'):
+    if precision not in PRECISIONS:
+        raise ValueError(f'precision must be one of {PRECISIONS}, not {precision}')
+    if precision == 'float32':
+        upper = pair_sums32(cost)
+        return (lambda combos: score_combinations32(upper, combos)), float32_slack(cost, m)
+    return (lambda combos: score_combinations(cost, combos)), 0.
+
+# keeps the k lowest-cost subsets seen so far, ties resolved by the lower rank,
+# i.e. the same subsets a sequential strict '<' scan would keep;
+# with epsilon it keeps every subset within epsilon of the lowest cost (at most k if k is not None);
+# with slack > 0 it also keeps every subset within slack of that selection, so that
+# approximate costs can be re-scored exactly afterwards (see rescored)
+class BestSubsets:
+    def __init__(self, m, k=1, slack=0., epsilon=None):
+        if k is None and epsilon is None:
+            raise ValueError('either k or epsilon is needed')
+        self.m = m
+        self.k = k
+        self.slack = slack
+        self.epsilon = epsilon
+        self.vals = np.empty(0)
+        self.ranks = np.empty(0, dtype=np.int64)
+        self.combos = np.empty((0, m), dtype=np.intp)
+
+    def __len__(self):
+        return len(self.vals)
+
+    # highest cost that can still be selected, given the (sorted or unsorted) costs seen
+    def limit(self, vals):
+        limit = np.inf
+        if self.k is not None and len(vals) >= self.k:
+            limit = np.partition(vals, self.k-1)[self.k-1] if len(vals) > self.k else vals.max()
+        if self.epsilon is not None and len(vals):
+            limit = min(limit, vals.min() + self.epsilon)
+        return limit
+
+    # no subset with a higher cost than this can enter
+    def threshold(self):
+        return self.limit(self.vals) + self.slack
+
+    def offer(self, vals, ranks, combos):
+        keep = vals <= self.threshold()
+        if not keep.any():
+            return
+        vals, ranks, combos = vals[keep], ranks[keep], combos[keep]
+        # cheap pre-selection, keeping all ties of the limit
+        keep = vals <= self.limit(vals) + self.slack
+        vals, ranks, combos = vals[keep], ranks[keep], combos[keep]
+        vals = np.concatenate([self.vals, vals])
+        ranks = np.concatenate([self.ranks, ranks])
+        combos = np.concatenate([self.combos, combos])
+        # a subset offered twice (e.g. by a solver revisiting its incumbent) is kept once
+        _, first = np.unique(ranks, return_index=True)
+        if len(first) < len(ranks):
+            vals, ranks, combos = vals[first], ranks[first], combos[first]
+        order = np.lexsort((ranks, vals))
+        order = order[vals[order] <= self.limit(vals) + self.slack]
+        if self.slack == 0 and self.k is not None:
+            order = order[:self.k]
+        self.vals, self.ranks, self.combos = vals[order], ranks[order], combos[order]
+
+    def merge(self, other):
+        self.offer(other.vals, other.ranks, other.combos)
+
+    # exact selection among the kept candidates, re-scored with the given cost matrix
+    def rescored(self, cost):
+        best = BestSubsets(self.m, self.k, epsilon=self.epsilon)
+        if len(self):
+            best.offer(score_combinations(cost, self.combos), self.ranks, self.combos)
+        return best
+
+################################
+# checkpoints
+################################
+
+# seconds between two checkpoints of a long enumeration
+CHECKPOINT_INTERVAL = 600
+
+# identifies the inputs of an enumeration, a checkpoint is only resumed for the same hash
+def input_hash(cost, m, k, epsilon, first=0, last=None, precision='float64'):
+    digest = hashlib.sha256(np.ascontiguousarray(cost, dtype=np.float64).tobytes())
+    digest.update(repr((len(cost), m, k, epsilon, first, last)).encode())
+    # float32 checkpoints keep approximate costs
+    if precision != 'float64':
+        digest.update(precision.encode())
+    return digest.hexdigest()
+
+# writes the next rank to score and the kept subsets; the file is replaced atomically
+def save_checkpoint(filename, digest, rank, best):
+    filename = Path(filename)
+    tmp = filename.with_name(filename.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        np.savez(f, input_hash=digest, rank=rank, vals=best.vals, ranks=best.ranks, combos=best.combos)
+    os.replace(tmp, filename)
+
+# (next rank, kept subsets) of a checkpoint of the same inputs, None if there is none
+def load_checkpoint(filename, digest, best):
+    if filename is None or not Path(filename).exists():
+        return None
+    with np.load(filename) as checkpoint:
+        if str(checkpoint['input_hash']) != digest:
+            print(f'ignoring checkpoint {filename} of different inputs')
+            return None
+        best.vals, best.ranks, best.combos = checkpoint['vals'], checkpoint['ranks'], checkpoint['combos'].astype(np.intp)
+        return int(checkpoint['rank'])
+
+# scores all n choose m subsets (or those of ranks first ... last-1) block by block and keeps
+# the k best (or those within epsilon); progress(done, total, best) is called after every block if given;
+# with a checkpoint file, the rank reached and the kept subsets are saved every checkpoint_interval
+# seconds and a restarted run with the same inputs continues from there (the file is removed at the end);
+# with constraints (see Constraints) only the feasible subsets are generated and scored;
+# precision 'float32' scores in float32 and re-scores the candidates exactly (see PRECISIONS)
+def best_subsets(cost, m, k=1, epsilon=None, rows=None, progress=None, first=0, last=None,
+                 checkpoint=None, checkpoint_interval=CHECKPOINT_INTERVAL, constraints=None, precision='float64'):
+    cost = np.ascontiguousarray(cost, dtype=np.float64)
+    n = len(cost)
+    score, slack = subset_scorer(cost, m, precision)
+    if constraints is not None:
+        if first != 0 or last is not None or checkpoint is not None:
+            raise ValueError('constrained enumerations cannot be split into rank ranges or checkpointed')
+        total = constrained_count(constraints, n, m)
+        best = BestSubsets(m, k, slack=slack, epsilon=epsilon)
+        done = 0
+        for ranks, combos in constrained_combination_blocks(constraints, n, m, rows):
+            best.offer(score(combos), ranks, combos)
+            done += len(combos)
+            if progress is not None:
+                progress(done, total, best)
+        return best.rescored(cost) if slack else best
+    total = combination_count(n, m) if last is None else last
+    best = BestSubsets(m, k, slack=slack, epsilon=epsilon)
+    digest = input_hash(cost, m, k, epsilon, first, last, precision) if checkpoint is not None else None
+    resume = load_checkpoint(checkpoint, digest, best)
+    start = first if resume is None else resume
+    saved = time.time()
+    for block_start, combos in combination_blocks(n, m, rows, start, last):
+        vals = score(combos)
+        best.offer(vals, np.arange(block_start, block_start+len(combos), dtype=np.int64), combos)
+        if checkpoint is not None and time.time() - saved > checkpoint_interval:
+            save_checkpoint(checkpoint, digest, block_start+len(combos), best)
+            saved = time.time()
+        if progress is not None:
+            progress(block_start+len(combos)-first, total-first, best)
+    if checkpoint is not None and Path(checkpoint).exists():
+        Path(checkpoint).unlink()
+    return best.rescored(cost) if slack else best
+
+# best_subsets with the rank space split into contiguous shards solved by max_workers processes;
+# every shard keeps its own k best (or those within epsilon of its own minimum), a superset of
+# its share of the global selection, and the merge orders by (cost, rank) like the serial scan,
+# so the result is identical to best_subsets; progress(done, total, best) is called per shard;
+# with a checkpoint file, every shard keeps its own checkpoint (<checkpoint>.<first rank>)
+def best_subsets_sharded(cost, m, k=1, epsilon=None, max_workers=2, shards=None, rows=None, progress=None,
+                         checkpoint=None, checkpoint_interval=CHECKPOINT_INTERVAL, precision='float64'):
+    cost = np.ascontiguousarray(cost, dtype=np.float64)
+    n = len(cost)
+    total = combination_count(n, m)
+    best = BestSubsets(m, k, epsilon=epsilon)
+    done = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(best_subsets, cost, m, k, epsilon, rows, None, first, last,
+                               None if checkpoint is None else f'{checkpoint}.{first}', checkpoint_interval, None, precision)
+                   for first, last in rank_shards(n, m, shards or max_workers)]
+        for future, (first, last) in zip(futures, rank_shards(n, m, shards or max_workers)):
+            best.merge(future.result())
+            done += last - first
+            if progress is not None:
+                progress(done, total, best)
+    return best
+
+# cost matrix of one grid point, (1-alpha-beta) * perf - alpha * dist - beta * change
+def cost_matrix(perf, dist, change, alpha, beta):
+    return (1-alpha-beta) * perf - alpha * dist - beta * change
+
+# scores all n choose m subsets once for a whole set of (alpha, beta) points:
+# each subset's component sums (P, D, C) are combined with all grid weights in one
+# (rows x 3) @ (3 x grid) product, the candidates of every grid point are re-scored
+# exactly at the end so the selection matches best_subsets for each point
+def best_subsets_grid(perf, dist, change, m, alphas, betas, k=1, epsilon=None, rows=None, progress=None):
+    perf, dist, change = [np.ascontiguousarray(a, dtype=np.float64) for a in (perf, dist, change)]
+    alphas = np.asarray(alphas, dtype=np.float64)
+    betas = np.asarray(betas, dtype=np.float64)
+    weights = np.stack([1-alphas-betas, -alphas, -betas])
+    npoint = weights.shape[1]
+    n = len(perf)
+    total = combination_count(n, m)
+    if rows is None:
+        rows = max(1, BLOCK_ELEMENTS // max(3*m*m, npoint))
+
+    # the product sums in another order than score_combinations, keep all candidates
+    # within a few orders of magnitude above that rounding error
+    slack = SLACK * cost_scale(max(np.abs(perf).max(), np.abs(dist).max(), np.abs(change).max()), m)
+    candidates = [BestSubsets(m, k, slack=slack, epsilon=epsilon) for _ in range(npoint)]
+    thresholds = np.full(npoint, np.inf)
+
+    for start, combos in combination_blocks(n, m, rows):
+        comps = np.stack([score_combinations(a, combos) for a in (perf, dist, change)], axis=1)
+        costs = comps @ weights
+        if k is not None and len(costs) > k:
+            block_kth = np.partition(costs, k-1, axis=0)[k-1]
+            thresholds = np.minimum(thresholds, block_kth + slack)
+        if epsilon is not None:
+            thresholds = np.minimum(thresholds, costs.min(axis=0) + epsilon + slack)
+        hit_rows, hit_points = np.nonzero(costs <= thresholds)
+        order = np.argsort(hit_points, kind='stable')
+        hit_rows, hit_points = hit_rows[order], hit_points[order]
+        points, first = np.unique(hit_points, return_index=True)
+        for point, rows_of_point in zip(points, np.split(hit_rows, first[1:])):
+            candidates[point].offer(costs[rows_of_point, point], start + rows_of_point.astype(np.int64), combos[rows_of_point])
+            thresholds[point] = candidates[point].threshold()
+        if progress is not None:
+            progress(start+len(combos), total, candidates)
+
+    return [cand.rescored(cost_matrix(perf, dist, change, alpha, beta))
+            for cand, alpha, beta in zip(candidates, alphas, betas)]
+
+# best_subsets of a stack of cost matrices (costs[b] of replicate b, e.g. resampled inputs) in
+# one enumeration: every block of combinations is generated once and gathered from all replicates
+# together; the per-subset sums reduce in the order of score_combinations, so replicate b selects
+# the same subsets as best_subsets(costs[b], ...); returns one BestSubsets per replicate
+def best_subsets_batch(costs, m, k=1, epsilon=None, rows=None, progress=None):
+    costs = np.ascontiguousarray(costs, dtype=np.float64)
+    nrep, n = costs.shape[:2]
+    total = combination_count(n, m)
+    if rows is None:
+        rows = block_rows(m, max(BLOCK_ELEMENTS // max(1, nrep), m*m))
+    bests = [BestSubsets(m, k, epsilon=epsilon) for _ in range(nrep)]
+    thresholds = np.full(nrep, np.inf)
+    replicates = np.arange(nrep)[:, None, None, None]
+
+    for start, combos in combination_blocks(n, m, rows):
+        nrow = len(combos)
+        # indexing every axis keeps the gathered sub-matrices C-ordered (see score_combinations)
+        vals = costs[replicates, combos[None, :, :, None], combos[None, :, None, :]].reshape(nrep, nrow, m*m).sum(axis=2)
+        ranks = np.arange(start, start+nrow, dtype=np.int64)
+        for replicate in np.nonzero((vals <= thresholds[:, None]).any(axis=1))[0]:
+            bests[replicate].offer(vals[replicate], ranks, combos)
+            thresholds[replicate] = bests[replicate].threshold()
+        if progress is not None:
+            progress(start+nrow, total, bests)
+    return bests
+
+################################
+# revolving-door order
+################################
+
+# In the revolving-door (combination Gray code) order consecutive subsets differ by one swap:
+#   R(n, m) = R(n-1, m), then R(n-1, m-1) reversed with n-1 added to every subset
+# which starts at {0, ..., m-1} and ends at {0, ..., m-2, n-1}.
+
+# all subsets of R(n, m) (or its reverse) as one array, rows sorted ascending
+@lru_cache(maxsize=256)
+def revolving_door_table(n, m, reverse=False):
+    if m == 0:
+        table = np.empty((1, 0), dtype=np.intp)
+    elif m == n:
+        table = np.arange(n, dtype=np.intp)[None, :]
+    else:
+        head = revolving_door_table(n-1, m)
+        tail = np.hstack([revolving_door_table(n-1, m-1, True), np.full((math.comb(n-1, m-1), 1), n-1, dtype=np.intp)])
+        table = np.concatenate([head, tail])
+        if reverse:
+            table = table[::-1]
+    table = np.ascontiguousarray(table)
+    table.flags.writeable = False
+    return table
+
+# pieces of R(n, m) in order, none larger than rows (unless rows < 1)
+def _revolving_door_pieces(n, m, reverse, rows):
+    if math.comb(n, m) <= rows or m == 0 or m == n:
+        yield revolving_door_table(n, m, reverse)
+        return
+    def with_last(pieces):
+        for piece in pieces:
+            yield np.hstack([piece, np.full((len(piece), 1), n-1, dtype=np.intp)])
+    if not reverse:
+        yield from _revolving_door_pieces(n-1, m, False, rows)
+        yield from with_last(_revolving_door_pieces(n-1, m-1, True, rows))
+    else:
+        yield from with_last(_revolving_door_pieces(n-1, m-1, False, rows))
+        yield from _revolving_door_pieces(n-1, m, True, rows)
+
+# yields consecutive blocks of the revolving-door order of about rows subsets each
+def revolving_door_blocks(n, m, rows=None):
+    if rows is None:
+        rows = block_rows(m)
+    buffer, buffered = [], 0
+    for piece in _revolving_door_pieces(n, m, False, rows):
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= rows:
+            yield np.concatenate(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield np.concatenate(buffer)
+
+# scores all subsets in revolving-door order: the cost of a subset follows from its predecessor's
+# after swapping member u for v, in O(m) from the row sums of pair = cost + cost.T,
+#   cost(S - u + v) = cost(S) + cost[v, v] - cost[u, u] + (sum_{i in S} pair[v, i] - pair[v, u])
+#                                                       - (sum_{i in S} pair[u, i] - pair[u, u])
+# every block starts from an exactly scored subset, the k best are re-scored exactly at the end
+def best_subsets_revolving_door(cost, m, k=1, epsilon=None, rows=None, progress=None):
+    cost = np.ascontiguousarray(cost, dtype=np.float64)
+    n = len(cost)
+    total = combination_count(n, m)
+    if rows is None:
+        rows = block_rows(m)
+    pair = cost + cost.T
+    diag = np.diag(cost)
+    # accumulated rounding of the incremental updates within one block
+    slack = max(SLACK, rows * 1e-15) * cost_scale(cost, m)
+    best = BestSubsets(m, k, slack=slack, epsilon=epsilon)
+    done = 0
+    for combos in revolving_door_blocks(n, m, rows):
+        costs = np.empty(len(combos))
+        costs[0] = score_combinations(cost, combos[:1])[0]
+        if len(combos) > 1:
+            # u leaves and v enters from one row to the next: v - u and v^2 - u^2 are the changes of
+            # the row sums of the members and of their squares (O(m) per subset)
+            sums, squares = combos.sum(axis=1), (combos*combos).sum(axis=1)
+            minus = np.diff(sums)
+            plus = np.diff(squares) // minus
+            u, v = (plus - minus) // 2, (plus + minus) // 2
+            previous = combos[:-1]
+            delta = (diag[v] - diag[u]
+                     + (pair[v[:, None], previous].sum(axis=1) - pair[v, u])
+                     - (pair[u[:, None], previous].sum(axis=1) - pair[u, u]))
+            costs[1:] = costs[0] + np.cumsum(delta)
+        candidates = costs <= min(best.threshold(), best.limit(costs) + slack)
+        best.offer(costs[candidates], combination_ranks(combos[candidates], n), combos[candidates])
+        done += len(combos)
+        if progress is not None:
+            progress(done, total, best)
+    return best.rescored(cost)
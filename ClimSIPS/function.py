@@ -11,13 +11,24 @@ import itertools
 import math
 import time
 import csv
+import hashlib
+import warnings
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
 
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 
 
 from . import member_selection as csms
+from . import enumeration as csen
+from . import hull_index as csh
+from . import solvers as css
+from . import numba_kernel as csnb
+from . import result_cache as csrc
+from . import bounds as csb
+from . import pareto as cspa
+from . import journal as csj
 
 ##################################################################
 # functions for output file creations
@@ -210,81 +221,733 @@ def normalize_independence_matrix(ds):
 # functions for model ensemble subselection
 ##################################################################
 
-# create csv with minimizing value and subset listed for each alpha-beta combo (one core)
-def multi_run(m, cmip, im_or_em, season_region, alpha_steps, beta_steps, perf_cutoff, data, min2=False):
-    min2_text=""
+# alpha-beta points of the ternary scan, in the order they are written to the csv
+def alpha_beta_grid(alpha_steps, beta_steps):
+    grid = []
+    for alpha_idx in range(0,alpha_steps+1):
+        for beta_idx in range(0,beta_steps+1):
+            alpha = alpha_idx/alpha_steps
+            beta = beta_idx/beta_steps
+            if alpha + beta > 1:
+                continue
+            grid.append((alpha, beta))
+    return grid
+
+# options of a selection, passed as one value from select_models and select down to get_best_m_models:
+# min2, top_k, epsilon (see ranking), solver, max_workers, time_budget, precision, constraints (see
+# get_best_m_models), scan, checkpoint_dir, result_cache (see scan_results), parallel, journal (see select_models)
+SearchOptions = namedtuple('SearchOptions', ['min2', 'solver', 'scan', 'top_k', 'epsilon', 'max_workers', 'parallel', 'checkpoint_dir',
+                                             'time_budget', 'precision', 'constraints', 'result_cache', 'journal'],
+                           defaults=[False, 'numpy', 'pointwise', None, None, 1, 'grid', None, None, 'float64', None, None, False])
+
+# options (SearchOptions() if None) with some of them replaced, e.g. search_options(options, solver='bnb')
+def search_options(options=None, **changes):
+    return (SearchOptions() if options is None else options)._replace(**changes)
+
+# number of kept subsets, epsilon window and whether a ranked list is returned
+# top_k: the top_k lowest-cost subsets, epsilon: all subsets within epsilon of the minimum
+def ranking(min2=False, top_k=None, epsilon=None):
+    if top_k is None and epsilon is None:
+        return (2 if min2 else 1), None, False
     if min2:
-        min2_text='min2_'
+        raise ValueError('min2 cannot be combined with top_k or epsilon')
+    if top_k is not None and top_k < 1:
+        raise ValueError(f'top_k must be at least 1, not {top_k}')
+    if epsilon is not None and not epsilon >= 0:
+        raise ValueError(f'epsilon must be at least 0, not {epsilon}')
+    return top_k, epsilon, True
+
+# (min_val, members), or (vals, [members, ...]) in ranked mode, from the kept subsets
+def selection_result(best, members, k, ranked):
+    if ranked:
+        return best.vals, [[members[i] for i in combo] for combo in best.combos]
+    if len(best) < k:
+        return np.inf, []
+    return best.vals[k-1], [members[i] for i in best.combos[k-1]]
+
+# label of the scan output files
+def scan_label(options):
+    label = ''
+    if options.min2:
+        label += 'min2_'
+    if options.top_k is not None:
+        label += f'top{options.top_k}_'
+    if options.epsilon is not None:
+        label += f'eps{options.epsilon}_'
+    if options.constraints:
+        label += 'constrained_'
+    return label
+
+# constraints on the selected members, dict(max_per_family=..., include=[...], exclude=[...]) with
+# families as grouped by get_model_base; returns the csen.Constraints of the members (None without any)
+def member_constraints(members, constraints):
+    if not constraints:
+        return None
+    include = list(constraints.get('include') or [])
+    exclude = list(constraints.get('exclude') or [])
+    missing = [member for member in include if member not in members]
+    if missing:
+        raise ValueError(f'members to include are not available (perf_cutoff?): {missing}')
+    if set(include) & set(exclude):
+        raise ValueError(f'members both included and excluded: {sorted(set(include) & set(exclude))}')
+    families = [get_model_base(member) for member in members]
+    return csen.Constraints(families, constraints.get('max_per_family'),
+                            tuple(members.index(member) for member in include),
+                            tuple(members.index(member) for member in exclude if member in members))
+
+# an existing scan csv is only rewritten with a result_cache, which holds its results (and those of an
+# interrupted scan) so that they are not solved again
+def check_scan_file(filename, result_cache=None):
+    if filename.exists() and result_cache is None:
+        raise RuntimeError(f'file exists! ({filename}, set result_cache to resume or rewrite a scan)')
+
+# csv header and rows of one grid point; ranked results get one row per subset with its rank
+def scan_header(m, ranked):
+    if ranked:
+        return ['alpha','beta','rank','min_val']+[f'member{i}' for i in range(m)]
+    return ['alpha','beta','min_val']+[f'member{i}' for i in range(m)]
+
+def scan_rows(alpha, beta, result, ranked):
+    if ranked:
+        return [[alpha,beta,rank,val]+members for rank, (val, members) in enumerate(zip(*result))]
+    min_val, min_member = result
+    return [[alpha,beta,min_val]+min_member]
+
+# create csv with minimizing value and subset listed for each alpha-beta combo (one core, see scan_results);
+# with journal, the results are appended to the netCDF journal of the scan instead (see scan_journal);
+# options: SearchOptions (changes replace some of them, e.g. min2=True), here and in the functions below
+def multi_run(m, cmip, im_or_em, season_region, alpha_steps, beta_steps, perf_cutoff, data, options=None, hull_index=None, **changes):
+    options = search_options(options, **changes)
+    k, epsilon, ranked = ranking(options.min2, options.top_k, options.epsilon)
+    min2_text = scan_label(options)
     filename=Path(cmip+'_'+im_or_em+'_'+season_region+'_'+min2_text+'alpha-beta-scan.csv')
-    if filename.exists():
-        raise RuntimeError('file exists!')
+    if options.journal:
+        filename = filename.with_suffix('.nc')
+        keys = selection_keys(data, m, alpha_beta_grid(alpha_steps, beta_steps), perf_cutoff, options, scan=options.scan)
+        known, record = scan_journal(filename, m, keys, ranked, perf_cutoff, data, options)
+        scan_results(m, alpha_steps, beta_steps, perf_cutoff, data, options, hull_index=hull_index, known=known, done=record, silent=False)
+        return filename
+    check_scan_file(filename, options.result_cache)
+    results = scan_results(m, alpha_steps, beta_steps, perf_cutoff, data, options, hull_index=hull_index, silent=False)
+    gaps = selection_gaps(results, m, perf_cutoff, data, options)
     with open(filename, 'w', newline='') as f:
         writer = csv.writer(f)
-        writer.writerow(['alpha','beta','min_val']+[f'member{i}' for i in range(m)])
-        for alpha_idx in range(0,alpha_steps+1):
-            for beta_idx in range(0,beta_steps+1):
-                alpha = alpha_idx/alpha_steps
-                beta = beta_idx/beta_steps
-                if alpha + beta > 1:
-                    continue
-                min_val, min_member = single_run(m, alpha, beta, perf_cutoff, data, silent=True, min2=min2)
-                print(alpha, beta, min_val, min_member)
-                writer.writerow([alpha,beta,min_val]+min_member)
+        writer.writerow(scan_header(m, ranked)+['gap'])
+        for alpha, beta in alpha_beta_grid(alpha_steps, beta_steps):
+            writer.writerows([row+[gaps[(alpha, beta)]['gap']] for row in scan_rows(alpha, beta, results[(alpha, beta)], ranked)])
     return filename
 
-# finds minimizing subset
-def single_run(m, alpha, beta, perf_cutoff, data, silent=False, min2=False):
-    n = len(data.delta_q)
+# minimizing value and subset of each alpha-beta combo, {(alpha, beta): result of single_run}
+# options: SearchOptions, of which scan_results uses (besides those of get_best_m_models)
+# scan: 'pointwise' solves every grid point on its own,
+#       'joint' enumerates the combinations once for all grid points (see joint_scan),
+#       'hull' looks every grid point up in the convex-hull index (see make_hull_index),
+#       'adaptive' solves only where neighbouring optima differ (see adaptive_scan)
+# max_workers: processes sharing the combinations of each grid point (see get_best_m_models)
+# checkpoint_dir: directory of the checkpoints of the grid points' enumerations (see checkpoint_file)
+# time_budget: seconds per grid point of solver 'anneal' (and 'auto' where it anneals)
+# precision: scoring precision of solvers 'numpy' and 'numba' (see get_best_m_models)
+# constraints: member constraints of every grid point (see member_constraints)
+# result_cache: result store (see result_cache.py), grid points found there are not solved again
+#               and solved ones are stored
+# known: {(alpha, beta): result} of grid points that are not solved again (e.g. from a journal),
+# done: done((alpha, beta), result) is called for every other grid point as soon as its result is known
+# silent: without printing each grid point's result
+def scan_results(m, alpha_steps, beta_steps, perf_cutoff, data, options=None, hull_index=None, known=None, done=None, silent=True, **changes):
+    options = search_options(options, **changes)
+    scan, result_cache = options.scan, options.result_cache
+    k, epsilon, ranked = ranking(options.min2, options.top_k, options.epsilon)
+    if options.constraints and scan in ['joint', 'hull']:
+        raise ValueError(f"scan='{scan}' does not support constraints")
+    grid = alpha_beta_grid(alpha_steps, beta_steps)
+    known = known or {}
+    cached = {}
+    # a non-pointwise scan solves all grid points together, unless known holds them all
+    solve = scan != 'pointwise' and len(known) < len(grid)
+    if result_cache is not None and solve:
+        keys = selection_keys(data, m, grid, perf_cutoff, options, scan=scan)
+        cached = csrc.lookup(result_cache, keys.values())
+    if scan != 'pointwise' and len(known) == len(grid):
+        results = dict(known)
+    elif scan != 'pointwise' and len(cached) == len(grid):
+        results = {point: cached[key] for point, key in keys.items()}
+    elif scan == 'joint':
+        results = joint_scan(m, alpha_steps, beta_steps, perf_cutoff, data, options)
+    elif scan == 'hull':
+        if options.min2 or ranked:
+            raise ValueError("only the minimum is a hull vertex, scan='hull' does not support min2, top_k or epsilon")
+        if hull_index is None:
+            hull_index = make_hull_index(m, perf_cutoff, data)
+        results = csh.hull_scan(hull_index, alpha_beta_grid(alpha_steps, beta_steps))
+    elif scan == 'adaptive':
+        if options.min2 or ranked:
+            raise ValueError("only the regions of the minimum are convex, scan='adaptive' does not support min2, top_k or epsilon")
+        results = adaptive_scan(m, alpha_steps, beta_steps, perf_cutoff, data, options)
+    elif scan != 'pointwise':
+        raise NotImplementedError(scan)
+    else:
+        results = {}
+    if result_cache is not None and solve and len(cached) < len(grid):
+        csrc.store(result_cache, {key: results[point] for point, key in keys.items()})
+    incumbent = None
+    for alpha, beta in grid:
+        if (alpha, beta) in known:
+            results[(alpha, beta)] = known[(alpha, beta)]
+        elif scan == 'pointwise':
+            # the previous grid point's optimum seeds the bound of the next search
+            results[(alpha, beta)] = single_run(m, alpha, beta, perf_cutoff, data, silent=True, options=options, incumbent=incumbent)
+        if done is not None and (alpha, beta) not in known:
+            done((alpha, beta), results[(alpha, beta)])
+        min_val, min_member = results[(alpha, beta)]
+        if not silent:
+            print(alpha, beta, min_val, min_member)
+        incumbent = min_member[0] if ranked and len(min_member) else min_member
+    return results
+
+# journal of a scan (see journal.py) with the selection keys of its grid points (see selection_keys):
+# returns the results of the grid points already in it, {(alpha, beta): result}, and
+# record((alpha, beta), result), which appends a grid point's result with its gap (see selection_gaps)
+def scan_journal(filename, m, keys, ranked, perf_cutoff, data, options):
+    present = csj.journal_keys(filename)
+    if present - set(keys.values()):
+        raise ValueError(f'journal {filename} holds results of other metrics or selection options, move it away to start a new one')
+    journaled = csj.lookup(filename, present, ranked)
+    known = {point: journaled[key] for point, key in keys.items() if key in journaled}
+    if known:
+        print(f'{len(known)} of {len(keys)} grid points found in {filename}')
+    def record(point, result):
+        gap = selection_gaps({point: result}, m, perf_cutoff, data, options)[point]['gap']
+        csj.append(filename, m, {keys[point]: (*point, result, gap)})
+    return known, record
+
+# performance, distance and spread metrics as DataArrays
+def metric_arrays(data):
     perf = xr.DataArray(data.delta_q.data, dims=['member'], coords=dict(member=data.delta_q.coords['member']))
     change_data = data.change.data
     dist_data = data.delta_i.data
     change = xr.DataArray(change_data, dims=['member','member_model'], coords=dict(member=data.change.coords['member'],member_model=data.change.coords['member_model']))
     dist = xr.DataArray(dist_data, dims=['member','member_model'], coords=dict(member=data.delta_i.coords['member'],member_model=data.delta_i.coords['member_model']))
-    min_val, min_members = get_best_m_models(perf, dist, change, m, alpha, beta, perf_cutoff, silent=silent, min2=min2)
+    return perf, dist, change
+
+# finds minimizing subset
+# (with top_k or epsilon, the ranked costs and member lists of all selected subsets)
+# result_cache: result store (see result_cache.py) looked up first and filled with the result;
+#               the heuristic solvers reuse a stored subset whatever incumbent it started from
+# deadline: end of the search (see get_best_m_models), a search stopped there is not stored
+def single_run(m, alpha, beta, perf_cutoff, data, silent=False, options=None, incumbent=None, info=None, deadline=None, **changes):
+    options = search_options(options, **changes)
+    perf, dist, change = metric_arrays(data)
+    if options.result_cache is not None:
+        key = selection_key(metrics_digest(perf, dist, change), m, alpha, beta, perf_cutoff, options)
+        cached = csrc.lookup(options.result_cache, [key])
+        if key in cached:
+            if info is not None and not options.min2:
+                info.update(selection_gaps({(alpha, beta): cached[key]}, m, perf_cutoff, data, options)[(alpha, beta)])
+            return cached[key]
+    min_val, min_members = get_best_m_models(perf, dist, change, m, alpha, beta, perf_cutoff, silent=silent, options=options, incumbent=incumbent, info=info,
+                                             checkpoint=checkpoint_file(options.checkpoint_dir, m, alpha, beta, perf_cutoff), deadline=deadline)
+    if options.result_cache is not None:
+        csrc.store(options.result_cache, {key: (min_val, min_members)})
     return min_val, min_members
 
+# certificates of the results of a scan ({(alpha, beta): result of single_run}), {(alpha, beta): dict(bound,
+# gap)} (see bounds.certificate): the gap is 0 where the solver (or scan 'hull') is exact, and the
+# best cost minus a lower bound on the minimum elsewhere (solver 'auto' where auto_solver anneals, with
+# max_workers and checkpoint as in get_best_m_models); the second minimum of min2 is not certified (NaN)
+def selection_gaps(results, m, perf_cutoff, data, options=None, **changes):
+    options = search_options(options, **changes)
+    if options.min2:
+        return {point: dict(bound=np.nan, gap=np.nan) for point in results}
+    perf, dist, change = metric_arrays(data)
+    norms = norm_matrices(perf, dist, change, perf_cutoff)
+    n = len(norms[0])
+    exact = options.solver in EXACT_SOLVERS or options.scan == 'hull'
+    if options.solver == 'auto':
+        exact = auto_solver(math.comb(n, m), options.constraints, options.max_workers, options.checkpoint_dir is not None) in EXACT_SOLVERS
+    certificates = {}
+    for (alpha, beta), (vals, members) in results.items():
+        lowest = vals[0] if np.ndim(vals) and len(vals) else (np.inf if np.ndim(vals) else vals)
+        certificates[(alpha, beta)] = csb.certificate(csen.cost_matrix(*norms, alpha, beta), m, lowest, exact=exact)
+    return certificates
+
+# key of one grid point's selection in the result store: the metrics and every option that changes
+# the result (scan 'pointwise' for single_run)
+def selection_key(digest, m, alpha, beta, perf_cutoff, options, scan='pointwise'):
+    return csrc.result_key(digest, m=m, alpha=alpha, beta=beta, perf_cutoff=perf_cutoff, scan=scan, min2=options.min2, solver=options.solver,
+                           top_k=options.top_k, epsilon=options.epsilon, time_budget=options.time_budget, constraints=sorted((options.constraints or {}).items()))
+
+# selection_key of every grid point, {(alpha, beta): key}
+def selection_keys(data, m, grid, perf_cutoff, options, scan='pointwise'):
+    digest = metrics_digest(*metric_arrays(data))
+    return {(alpha, beta): selection_key(digest, m, alpha, beta, perf_cutoff, options, scan) for alpha, beta in grid}
+
+# finds the minimizing subset of every alpha-beta grid point in one pass over the combinations;
+# the cost is linear in alpha and beta, so each subset's performance, independence and spread
+# sums are computed once and weighted for all grid points together.
+# returns {(alpha, beta): (min_val, members)} with the same values as single_run
+def joint_scan(m, alpha_steps, beta_steps, perf_cutoff, data, options=None, silent=True, **changes):
+    options = search_options(options, **changes)
+    if options.solver != 'numpy':
+        raise ValueError(f"scan='joint' enumerates all combinations, solver {options.solver} is not supported")
+    perf, dist, change = metric_arrays(data)
+    members = list(perf.where(perf<perf_cutoff, drop=True).member.data)
+    norm_perf, norm_dist, norm_change = norm_matrices(perf, dist, change, perf_cutoff)
+    grid = alpha_beta_grid(alpha_steps, beta_steps)
+    alphas = [alpha for alpha, beta in grid]
+    betas = [beta for alpha, beta in grid]
+
+    start_time = time.time()
+    def progress(done, total, candidates):
+        percent = done / total
+        eta = (1-percent) * (time.time() - start_time) / percent
+        print(f"{100*percent:>4.1f}% / eta in {eta/60:.1f} min")
+
+    k, epsilon, ranked = ranking(options.min2, options.top_k, options.epsilon)
+    bests = csen.best_subsets_grid(norm_perf, norm_dist, norm_change, m, alphas, betas, k=k, epsilon=epsilon,
+                                   progress=None if silent else progress)
+    results = {}
+    for alpha, beta, best in zip(alphas, betas, bests):
+        results[(alpha, beta)] = selection_result(best, members, k, ranked)
+    return results
+
+# The cost of a subset S is linear in alpha and beta, c0 + c1 * alpha + c2 * beta with c0 = P,
+# c1 = -(P + D), c2 = -(P + C) for its normalized performance, independence and spread sums (P, D, C),
+# so the minimum over all subsets is a concave piecewise-linear function of (alpha, beta) whose
+# pieces are convex polygons. adaptive_scan keeps the subsets found so far and the vertices of the
+# lower envelope of their planes on the triangle alpha, beta >= 0, alpha + beta <= 1. Every vertex is
+# solved once; a subset not yet known is added and the envelope refined, until all vertices return
+# known subsets. The envelope of the known subsets is then the true minimum on every polygon (it is
+# linear there, the true minimum is concave and both agree at the corners).
+
+# vertices of the lower envelope of the planes c0 + c1 * alpha + c2 * beta on the alpha-beta triangle
+def envelope_vertices(c0, c1, c2, tol):
+    points = [np.array([[0., 0.], [1., 0.], [0., 1.]])]
+    i, j = np.triu_indices(len(c0), k=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # pairs of planes on the edges alpha = 0, beta = 0 and alpha + beta = 1
+        beta = (c0[j]-c0[i]) / (c2[i]-c2[j])
+        points.append(np.stack([np.zeros_like(beta), beta], axis=1))
+        alpha = (c0[j]-c0[i]) / (c1[i]-c1[j])
+        points.append(np.stack([alpha, np.zeros_like(alpha)], axis=1))
+        beta = ((c0[j]+c1[j]) - (c0[i]+c1[i])) / ((c2[i]-c1[i]) - (c2[j]-c1[j]))
+        points.append(np.stack([1-beta, beta], axis=1))
+    # triples of planes
+    i, j, k = np.array(list(itertools.combinations(range(len(c0)), 3)), dtype=int).reshape(-1, 3).T
+    a = np.stack([np.stack([c1[i]-c1[j], c2[i]-c2[j]], axis=1), np.stack([c1[i]-c1[k], c2[i]-c2[k]], axis=1)], axis=1)
+    b = np.stack([c0[j]-c0[i], c0[k]-c0[i]], axis=1)
+    regular = np.abs(np.linalg.det(a)) > 1e-12 if len(a) else np.zeros(0, dtype=bool)
+    if regular.any():
+        points.append(np.linalg.solve(a[regular], b[regular][:, :, None])[:, :, 0])
+    points = np.concatenate(points)
+    points = points[np.isfinite(points).all(axis=1)]
+    points = points[(points >= -1e-12).all(axis=1) & (points.sum(axis=1) <= 1+1e-12)]
+    points = np.clip(points, 0, 1)
+    values = c0[None, :] + points[:, :1] * c1[None, :] + points[:, 1:] * c2[None, :]
+    lowest = values.min(axis=1, keepdims=True)
+    # a vertex of the envelope lies on at least three of its planes (or edges)
+    on_envelope = (values <= lowest + tol).sum(axis=1)
+    edges = (points[:, 0] <= 1e-12).astype(int) + (points[:, 1] <= 1e-12) + (points.sum(axis=1) >= 1-1e-12)
+    points = points[on_envelope + edges >= 3]
+    return np.unique(points.round(12), axis=0)
+
+# finds the minimizing subset of every alpha-beta grid point with a number of solves that does not
+# depend on the grid resolution: the coarse x coarse grid seeds the known subsets, then the vertices
+# of their lower envelope are solved (see envelope_vertices) until no new subset appears; every grid
+# point then takes the known subset of lowest cost (exactly summed, ties by rank), points where two
+# known subsets are within rounding of each other are solved directly.
+# returns {(alpha, beta): (min_val, members)} with the same values as single_run; info['solves']
+# receives the number of solved points
+def adaptive_scan(m, alpha_steps, beta_steps, perf_cutoff, data, options=None, coarse=4, silent=True, info=None, **changes):
+    options = search_options(options, **changes)
+    perf, dist, change = metric_arrays(data)
+    members = list(perf.where(perf<perf_cutoff, drop=True).member.data)
+    n = len(members)
+    norm_perf, norm_dist, norm_change = norm_matrices(perf, dist, change, perf_cutoff)
+    tol = css.SLACK * css.cost_scale(np.abs(norm_perf) + np.abs(norm_dist) + np.abs(norm_change), m)
+
+    solved = {}
+    known = {}
+    last = [None]
+    def solve(alpha, beta):
+        if (alpha, beta) not in solved:
+            # the previous optimum seeds the bound of the next search
+            solved[(alpha, beta)] = single_run(m, alpha, beta, perf_cutoff, data, silent=True, options=options, incumbent=last[0])
+            subset = last[0] = solved[(alpha, beta)][1]
+            if not silent:
+                print(f'solved {alpha}/{beta}: {solved[(alpha, beta)][0]}')
+            if tuple(subset) not in known and len(subset):
+                combo = np.array([[members.index(member) for member in subset]])
+                known[tuple(subset)] = [csen.score_combinations(a, combo)[0] for a in (norm_perf, norm_dist, norm_change)]
+        return solved[(alpha, beta)][1]
+
+    for alpha, beta in alpha_beta_grid(coarse, coarse):
+        solve(alpha, beta)
+    while True:
+        count = len(known)
+        P, D, C = np.array(list(known.values())).T
+        for alpha, beta in envelope_vertices(P, -(P+D), -(P+C), tol):
+            solve(float(alpha), float(beta))
+        if len(known) == count:
+            break
+
+    subsets = list(known)
+    combos = np.array([[members.index(member) for member in subset] for subset in subsets])
+    ranks = csen.combination_ranks(combos, n)
+    results = {}
+    for alpha, beta in alpha_beta_grid(alpha_steps, beta_steps):
+        # costs of the known subsets, summed as in get_best_m_models
+        cost = csen.cost_matrix(norm_perf, norm_dist, norm_change, alpha, beta)
+        vals = csen.score_combinations(cost, combos)
+        order = np.lexsort((ranks, vals))
+        if len(order) > 1 and vals[order[1]] - vals[order[0]] <= tol:
+            solve(alpha, beta)
+        if (alpha, beta) in solved:
+            results[(alpha, beta)] = solved[(alpha, beta)]
+        else:
+            results[(alpha, beta)] = (vals[order[0]], list(subsets[order[0]]))
+    if info is not None:
+        info['solves'] = len(solved)
+    return results
+
+# convex-hull index of the subset component sums, answers single_run for any alpha and beta
+def make_hull_index(m, perf_cutoff, data, silent=True):
+    perf, dist, change = metric_arrays(data)
+    members = list(perf.where(perf<perf_cutoff, drop=True).member.data)
+    norm_perf, norm_dist, norm_change = norm_matrices(perf, dist, change, perf_cutoff)
+    return csh.build_hull_index(norm_perf, norm_dist, norm_change, m, members, silent=silent)
+
+# loads the hull index stored next to the outfile, (re)builds it if missing or older than the outfile
+def get_hull_index(outfile, m, perf_cutoff, silent=True):
+    filename = csh.hull_index_file(outfile, m, perf_cutoff)
+    if filename.exists() and filename.stat().st_mtime >= Path(outfile).stat().st_mtime:
+        return csh.load_hull_index(filename)
+    data = xr.open_dataset(outfile,use_cftime = True)
+    index = make_hull_index(m, perf_cutoff, data, silent=silent)
+    csh.save_hull_index(index, filename)
+    return index
+
+# Pareto front of the subsets' performance, independence and spread sums (see pareto.py), in one
+# pass over the combinations; it holds the optimum of every alpha-beta point and the unsupported
+# trade-offs in between
+def make_pareto_front(m, perf_cutoff, data, silent=True):
+    perf, dist, change = metric_arrays(data)
+    members = list(perf.where(perf<perf_cutoff, drop=True).member.data)
+    norm_perf, norm_dist, norm_change = norm_matrices(perf, dist, change, perf_cutoff)
+    return cspa.build_pareto_front(norm_perf, norm_dist, norm_change, m, members, silent=silent)
+
+# writes the Pareto front csv next to the scan csv (see save_pareto_front)
+def pareto_run(m, cmip, im_or_em, season_region, perf_cutoff, data, silent=True):
+    filename = Path(cmip+'_'+im_or_em+'_'+season_region+'_'+f'm{m}_pareto-front.csv')
+    front = make_pareto_front(m, perf_cutoff, data, silent=silent)
+    print(f"{len(front.point)} Pareto-optimal subsets of m={m}, {int(front.supported.sum())} selectable by a weighted cost")
+    return cspa.save_pareto_front(front, filename)
+
 # normalizing metrics so they contribute equally to the cost function
+# normalized matrices of the members with perf < perf_cutoff as plain contiguous (read-only) arrays:
+# the performance on the diagonal of norm_perf, independence and spread off the diagonal of norm_dist
+# and norm_change. The statistics are taken over the same NaN-masked matrices as before, so the
+# values are unchanged; results are cached by the content of the metrics and perf_cutoff, every
+# grid point (and every worker of a pool) normalizes the same data only once
 def norm_matrices(perf, dist, change, perf_cutoff):
-    members = list(perf.where(perf<perf_cutoff, drop=True).member.data) # drop members above the performance threshold
-    n = len(members)
-    perf = perf.sel(member=members)
-    dist = dist.sel(member=members, member_model=members)
-    change = change.sel(member=members, member_model=members)
+    key = (metrics_digest(perf, dist, change), perf_cutoff)
+    if key not in _norm_cache:
+        if len(_norm_cache) >= NORM_CACHE_SIZE:
+            del _norm_cache[next(iter(_norm_cache))]
+        _norm_cache[key] = compute_norm_matrices(perf, dist, change, perf_cutoff)
+    return _norm_cache[key]
+
+# normalized matrices kept by norm_matrices
+NORM_CACHE_SIZE = 8
+_norm_cache = {}
+
+# hash of the values and coordinates of the metrics
+def metrics_digest(perf, dist, change):
+    digest = hashlib.sha256()
+    for metric in (perf, dist, change):
+        digest.update(np.ascontiguousarray(metric.data, dtype=np.float64).tobytes())
+        for dim in metric.dims:
+            digest.update(repr((dim, [str(coord) for coord in metric.coords[dim].data])).encode())
+    return digest.hexdigest()
+
+def compute_norm_matrices(perf, dist, change, perf_cutoff):
+    members = list(perf.member.data[perf.data < perf_cutoff]) # drop members above the performance threshold
+    perf = perf.sel(member=members).data
+    dist = dist.sel(member=members, member_model=members).data
+    change = change.sel(member=members, member_model=members).data
+    norms = normalize(perf, dist, change)
+    for norm in norms:
+        norm.flags.writeable = False
+    return norms
 
-    norm_dist = (dist - np.nanmean(dist))/np.nanstd(dist)/2 # /2 is due to double count ij, ji
-    norm_change = (change - np.nanmean(change))/np.nanstd(change)/2
+# normalized matrices of norm_matrices from plain arrays (perf (n,), dist and change (n, n));
+# the statistics are taken over the ensemble of the indices in sample (default all members,
+# repetitions allowed, e.g. a bootstrap sample) and applied to all members
+def normalize(perf, dist, change, sample=None):
+    perf, dist, change = (np.asarray(metric, dtype=np.float64) for metric in (perf, dist, change))
+    n = len(perf)
+    if sample is None:
+        sample = np.arange(n)
+    diagonal = np.eye(n, dtype=bool)
+    ensemble = np.ix_(sample, sample)
+
+    norm_dist = (dist - np.nanmean(dist[ensemble]))/np.nanstd(dist[ensemble])/2 # /2 is due to double count ij, ji
+    norm_change = (change - np.nanmean(change[ensemble]))/np.nanstd(change[ensemble])/2
 
     # to save operations, we store the performance on the diagonal elements of the distance matrix
     # and pre-calculate the alpha mix.
-    perf_diag = xr.DataArray(np.diag(perf.data),dims=['member','member_model'],coords=dict(member=members, member_model=members))
-    for i in range(n):
-        for j in range(n):
-            if i==j:
-                continue
-            perf_diag[i,j]=np.nan
+    perf_diag = np.where(np.eye(len(sample), dtype=bool), perf[sample], np.nan)
+    norm_perf = np.where(diagonal, (perf - np.nanmean(perf_diag))/np.nanstd(perf_diag), 0.)
 
-    norm_perf = (perf_diag - np.nanmean(perf_diag))/np.nanstd(perf_diag)
+    norm_dist[diagonal] = 0
+    norm_change[diagonal] = 0
 
-    for i in range(n):
-        for j in range(n):
-            if i==j:
-                norm_dist[i,j] = 0
-                norm_change[i,j] = 0
-            else:
-                norm_perf[i,j]=0
+    return tuple(np.ascontiguousarray(norm) for norm in (norm_perf, norm_dist, norm_change))
+
+# solver 'auto' enumerates all combinations up to this many (with numba: NUMBA_EXHAUSTIVE_LIMIT), and anneals beyond
+EXHAUSTIVE_LIMIT = 10**8
+NUMBA_EXHAUSTIVE_LIMIT = 10**10
+
+# default seconds per search of solver 'anneal'
+ANNEAL_TIME_BUDGET = 60
+
+# a search stopped at its deadline (see get_best_m_models)
+class SearchTimeout(TimeoutError):
+    pass
 
-    return norm_perf, norm_dist, norm_change
+# solvers that return the optimum (the others are bounded from below, see bounds.py)
+EXACT_SOLVERS = ['numpy', 'numba', 'revolving_door', 'xarray', 'bnb', 'milp', 'certified']
+
+# the solver of 'auto' for this many combinations: with member constraints 'numpy' up to
+# EXHAUSTIVE_LIMIT and 'milp' beyond, else 'numba' up to NUMBA_EXHAUSTIVE_LIMIT (if installed, one
+# process without checkpoints) or 'numpy' up to EXHAUSTIVE_LIMIT, and 'anneal' beyond
+def auto_solver(total_combinations, constraints=None, max_workers=1, checkpoint=False):
+    if constraints:
+        return 'numpy' if total_combinations <= EXHAUSTIVE_LIMIT else 'milp'
+    if csnb.available() and max_workers == 1 and not checkpoint:
+        return 'numba' if total_combinations <= NUMBA_EXHAUSTIVE_LIMIT else 'anneal'
+    return 'numpy' if total_combinations <= EXHAUSTIVE_LIMIT else 'anneal'
+
+# the checkpoint and max_workers of the solver that 'auto' resolved to: only 'numpy' without member
+# constraints writes checkpoints and splits into rank shards, the other solvers run without them
+# (with a warning) instead of failing in the middle of a scan
+def auto_fallback(solver, total_combinations, checkpoint, max_workers, sharded=('numpy',)):
+    if checkpoint is not None and solver not in sharded:
+        warnings.warn(f"solver 'auto' uses '{solver}' for {total_combinations} combinations, which writes no checkpoints")
+        checkpoint = None
+    if max_workers > 1 and solver not in sharded:
+        warnings.warn(f"solver 'auto' uses '{solver}' for {total_combinations} combinations, which runs in one process")
+        max_workers = 1
+    return checkpoint, max_workers
 
 # check all combinations to determine the cost-function-minimizing subset
-def get_best_m_models(perf, dist, change, m, alpha, beta, perf_cutoff, silent=True, min2=False):
-    members = list(perf.where(perf<perf_cutoff, drop=True).member.data)
+# solver: 'numpy' scores blocks of combinations as plain arrays,
+#         'xarray' scores one combination at a time (reference implementation),
+#         'bnb' exact branch and bound, pruning partial subsets with lower bounds,
+#         'milp' linearized mixed-integer program solved with scipy's HiGHS,
+#         'revolving_door' enumeration in Gray-code order with O(m) cost updates per subset,
+#         'anneal' simulated annealing for time_budget seconds (best subset found, no proof of optimality),
+#         'auto' exhaustive ('numba' or 'numpy') up to the limits of auto_solver, 'anneal' beyond,
+#         'local' greedy construction and 1-/2-swap tabu local search (deterministic, no proof of optimality),
+#         'numba' compiled parallel enumeration (same result as 'numpy'; falls back to it without numba),
+#         'certified' 'local' search, verified by 'bnb' (seeded with its subset) only where the lower
+#                     bound of bounds.py leaves a gap (and always for min2, top_k and epsilon)
+# options: SearchOptions (see search_options), of which min2, solver, top_k, epsilon, max_workers,
+#          time_budget, precision and constraints are used here:
+# incumbent: members of a known good subset (e.g. the optimum of a neighbouring alpha-beta point);
+#            fewer than m members (e.g. the optimum of a smaller m) are completed greedily
+# info: optional dict receiving solver diagnostics, for every solver the lower bound on the minimum
+#       cost (bound) and by how much the best subset found may exceed it (gap, 0 for the exact
+#       solvers; see bounds.certificate, not for min2), e.g. the status of 'milp' and the trace of 'anneal'
+# top_k / epsilon: return the top_k best subsets / all subsets within epsilon of the minimum
+# max_workers: with solver 'numpy', the combinations are split into contiguous rank ranges
+#              searched by max_workers processes and merged (same result as one process)
+# checkpoint: file where solver 'numpy' periodically saves the rank reached and the subsets kept so far;
+#             a restarted run with the same inputs continues from there ('auto' drops it where it
+#             does not enumerate with 'numpy', see auto_fallback)
+# time_budget: seconds of solver 'anneal' (default ANNEAL_TIME_BUDGET), info['trace'] receives its
+#              (seconds, moves, best cost) trace
+# precision: 'float32' scores the combinations of solvers 'numpy' and 'numba' in float32 and re-scores
+#            the candidates in float64 (same result, see csen.PRECISIONS); the other solvers ignore it
+# constraints: dict(max_per_family=..., include=[...], exclude=[...]) (see member_constraints), enforced
+#              while enumerating by solver 'numpy' and as linear constraints by 'milp'
+# norms: norm_matrices(perf, dist, change, perf_cutoff) if already computed (e.g. for several m)
+# deadline: time.time() by which the search must end, else it stops between two blocks (or bnb nodes,
+#           or at the milp time limit) with SearchTimeout; 'numba' is searched by 'numpy' (its compiled
+#           kernel cannot be interrupted) and 'xarray' is refused
+def get_best_m_models(perf, dist, change, m, alpha, beta, perf_cutoff, silent=True, options=None, incumbent=None, info=None, checkpoint=None, norms=None, deadline=None, **changes):
+    options = search_options(options, **changes)
+    min2, solver, top_k, epsilon, max_workers = options.min2, options.solver, options.top_k, options.epsilon, options.max_workers
+    time_budget, precision, constraints = options.time_budget, options.precision, options.constraints
+    members = list(perf.member.data[perf.data < perf_cutoff])
     n = len(members)
     if not silent:
         print(f'using {n} models with perf < {perf_cutoff}')
 
-    norm_perf, norm_dist, norm_change = norm_matrices(perf, dist, change, perf_cutoff)
-    cost_matrix = (1-alpha-beta) * norm_perf - alpha * norm_dist - beta * norm_change
+    norm_perf, norm_dist, norm_change = norm_matrices(perf, dist, change, perf_cutoff) if norms is None else norms
+    cost_matrix = csen.cost_matrix(norm_perf, norm_dist, norm_change, alpha, beta)
+
+    total_combinations = csen.combination_count(n, m)
+    start_time = time.time()
+
+    k, epsilon, ranked = ranking(min2, top_k, epsilon)
+    constraints = member_constraints(members, constraints)
+    if constraints is not None:
+        total_combinations = csen.constrained_count(constraints, n, m)
+        if not silent:
+            print(f'{total_combinations} combinations satisfy the member constraints')
+        if solver == 'auto':
+            solver = auto_solver(total_combinations, constraints)
+            checkpoint, max_workers = auto_fallback(solver, total_combinations, checkpoint, max_workers, sharded=())
+        if solver not in ['numpy', 'milp'] or max_workers > 1 or checkpoint is not None:
+            raise ValueError("member constraints need solver 'numpy' (one process, without checkpoints) or 'milp'")
+    if solver == 'auto':
+        solver = auto_solver(total_combinations, max_workers=max_workers, checkpoint=checkpoint is not None)
+        checkpoint, max_workers = auto_fallback(solver, total_combinations, checkpoint, max_workers)
+        if not silent:
+            print(f"{total_combinations} combinations, using solver '{solver}'")
+    if solver == 'numba' and not csnb.available():
+        if not silent:
+            print("numba is not installed, using solver 'numpy'")
+        solver = 'numpy'
+    if deadline is not None and solver == 'numba':
+        solver = 'numpy'
+    if deadline is not None and solver == 'xarray':
+        raise ValueError("solver 'xarray' cannot be interrupted at a deadline")
+    if max_workers > 1 and solver != 'numpy':
+        raise ValueError(f"solver '{solver}' cannot be split into rank shards, use solver 'numpy'")
+    if checkpoint is not None and solver != 'numpy':
+        raise ValueError(f"solver '{solver}' does not write checkpoints, use solver 'numpy'")
+    cost = cost_matrix
+    if solver == 'xarray':
+        if ranked:
+            raise ValueError("solver 'xarray' does not support top_k or epsilon")
+        cost_matrix = xr.DataArray(cost_matrix, dims=['member','member_model'], coords=dict(member=members, member_model=members))
+        minX_val, minX_combo = get_best_m_models_xarray(cost_matrix, members, m, silent=silent, min2=min2)
+    elif solver in ['numpy', 'numba', 'revolving_door', 'bnb', 'milp', 'anneal', 'local', 'certified']:
+        def progress(done, total, best):
+            if deadline is not None and time.time() > deadline:
+                raise SearchTimeout(f'the search passed its deadline after {done} of {total} combinations')
+            if silent:
+                return
+            # this part displays progress, requires silent = False
+            percent = done / total
+            eta = (1-percent) * (time.time() - start_time) / percent
+            print(f"{100*percent:>4.1f}% / eta in {eta/60:.1f} min / best score {best.vals[-1]:.3f}")
+            print(f"{', '.join(members[i] for i in best.combos[-1])}")
+        if solver == 'numpy' and max_workers > 1:
+            best = csen.best_subsets_sharded(cost_matrix, m, k=k, epsilon=epsilon, max_workers=max_workers, progress=None if silent and deadline is None else progress, checkpoint=checkpoint, precision=precision)
+        elif solver == 'numpy':
+            best = csen.best_subsets(cost_matrix, m, k=k, epsilon=epsilon, progress=None if silent and deadline is None else progress, checkpoint=checkpoint, constraints=constraints, precision=precision)
+        elif solver == 'numba':
+            best = csnb.best_subsets_numba(cost_matrix, m, k=k, epsilon=epsilon, progress=None if silent and deadline is None else progress, precision=precision)
+        elif solver == 'revolving_door':
+            best = csen.best_subsets_revolving_door(cost_matrix, m, k=k, epsilon=epsilon, progress=None if silent and deadline is None else progress)
+        elif solver == 'milp':
+            if info is None:
+                info = {}
+            time_limit = None if deadline is None else max(deadline - time.time(), 0.)
+            best = css.milp_subsets(cost_matrix, m, k=k, epsilon=epsilon, time_limit=time_limit, info=info, member_constraints=constraints)
+            if deadline is not None and time.time() > deadline:
+                raise SearchTimeout('the milp search passed its deadline')
+            if not silent:
+                print(f"milp: {info['status']} / optimality gap {info['gap']:.2e}")
+        else:
+            def bnb_progress(nodes, elapsed, best):
+                if deadline is not None and time.time() > deadline:
+                    raise SearchTimeout(f'the search passed its deadline after {nodes} nodes')
+                if silent:
+                    return
+                print(f"{nodes} nodes in {elapsed/60:.1f} min / best score {best.vals[-1]:.3f}")
+            if incumbent is not None and len(incumbent) <= m and all(member in members for member in incumbent):
+                incumbent = sorted(members.index(member) for member in incumbent)
+                if len(incumbent) < m:
+                    incumbent = css.greedy_subset(cost_matrix, m, start=incumbent)
+            else:
+                incumbent = None
+            if solver == 'anneal':
+                def anneal_progress(moves, elapsed, best):
+                    print(f"{moves} moves in {elapsed:.1f} s / best score {best.vals[0]:.3f}")
+                if info is None:
+                    info = {}
+                info['trace'] = []
+                best = css.simulated_annealing(cost_matrix, m, k=k, epsilon=epsilon, incumbent=incumbent,
+                                               time_budget=ANNEAL_TIME_BUDGET if time_budget is None else time_budget,
+                                               trace=info['trace'], progress=None if silent else anneal_progress)
+            elif solver == 'local':
+                best = css.local_search(cost_matrix, m, k=k, epsilon=epsilon, incumbent=incumbent)
+            elif solver == 'certified':
+                best = css.local_search(cost_matrix, m, k=k, epsilon=epsilon, incumbent=incumbent)
+                if k != 1 or ranked or csb.certificate(cost_matrix, m, best.vals[0])['gap'] > 0:
+                    if not silent:
+                        print("the local search is not certified optimal, verifying with solver 'bnb'")
+                    best = css.branch_and_bound(cost_matrix, m, k=k, epsilon=epsilon, incumbent=list(best.combos[0]), progress=None if silent and deadline is None else bnb_progress)
+            else:
+                best = css.branch_and_bound(cost_matrix, m, k=k, epsilon=epsilon, incumbent=incumbent, progress=None if silent and deadline is None else bnb_progress)
+        if ranked:
+            # details below are printed for the best subset
+            k = 1
+        if len(best) < k:
+            minX_val, minX_combo = np.inf, []
+        else:
+            minX_val, minX_combo = best.vals[k-1], list(best.combos[k-1])
+    else:
+        raise NotImplementedError(solver)
+    minX_members = [members[i] for i in minX_combo]
+    if info is not None and not min2:
+        lowest = minX_val if solver == 'xarray' else (best.vals[0] if len(best) else np.inf)
+        info.update(csb.certificate(cost, m, lowest, exact=solver in EXACT_SOLVERS))
 
+    if not silent:
+        if solver in ['numpy', 'numba', 'revolving_door', 'xarray']:
+            print(f"all {total_combinations} combinations tested, which took {(time.time() - start_time)/60:.1f} min")
+        else:
+            print(f"{solver} search over {total_combinations} combinations took {(time.time() - start_time)/60:.1f} min")
+        print(f"min val (alpha={alpha}): {minX_val}")
+        if info is not None and 'gap' in info:
+            print(f"lower bound {info['bound']:.3f} / gap {info['gap']:.3f}")
+        print(f"min members:")
+        for index, member in zip(minX_combo, minX_members):
+            distances = [f"{dist[index, i].data:>6.2f}" for i in minX_combo]
+            spreads = [f"{change[index, i].data:>6.2f}" for i in minX_combo]
+            print(f" * {member:>24}   perf: {perf[index].data:>6.2f} dist: {' '.join(distances)} spread: {' '.join(spreads)}") # avr_dist: {avr_dist[index].data:>6.2f}
+        if ranked:
+            print(f"{len(best)} subsets selected, costs {' '.join(f'{val:.3f}' for val in best.vals)}")
+    if ranked:
+        return selection_result(best, members, k, ranked)
+    return minX_val, minX_members
+
+# best subsets of every size in m_range at one grid point, {m: result of get_best_m_models};
+# the normalized matrices are computed once for all sizes, and the best subset of each size
+# (completed greedily) seeds the bound of the next larger one (solvers 'bnb', 'anneal', 'local');
+# incumbent seeds the smallest size, checkpoint_dir holds one checkpoint per size (see checkpoint_file)
+def get_best_models_m_range(perf, dist, change, m_range, alpha, beta, perf_cutoff, options=None, incumbent=None, silent=True, **changes):
+    options = search_options(options, **changes)
+    norms = norm_matrices(perf, dist, change, perf_cutoff)
+    k, epsilon, ranked = ranking(options.min2, options.top_k, options.epsilon)
+    results = {}
+    for m in sorted(m_range):
+        checkpoint = checkpoint_file(options.checkpoint_dir, m, alpha, beta, perf_cutoff)
+        result = get_best_m_models(perf, dist, change, m, alpha, beta, perf_cutoff, silent=silent, options=options, incumbent=incumbent, checkpoint=checkpoint, norms=norms)
+        results[m] = result
+        min_val, min_member = result
+        incumbent = min_member[0] if ranked and len(min_member) else min_member
+    return results
+
+# how often a (heuristic) solver finds the subset of an exact reference solver on an alpha-beta grid;
+# returns the number of grid points, the agreeing ones and the largest cost excess of the solver
+def solver_agreement(data, m, alpha_steps, beta_steps, perf_cutoff, solver='local', reference='numpy'):
+    points = agree = 0
+    max_excess = 0.
+    for alpha, beta in alpha_beta_grid(alpha_steps, beta_steps):
+        val, members = single_run(m, alpha, beta, perf_cutoff, data, silent=True, solver=solver)
+        ref_val, ref_members = single_run(m, alpha, beta, perf_cutoff, data, silent=True, solver=reference)
+        points += 1
+        agree += sorted(members) == sorted(ref_members)
+        max_excess = max(max_excess, float(val - ref_val))
+    return dict(points=points, agree=agree, agreement=agree/points, max_excess=max_excess)
+
+# one xarray selection per combination (slow, kept as reference for the other solvers)
+def get_best_m_models_xarray(cost_matrix, members, m, silent=True, min2=False):
     def cost_function(combo):
         return cost_matrix.isel(member=combo, member_model=combo).sum()
 
@@ -293,7 +956,8 @@ def get_best_m_models(perf, dist, change, m, alpha, beta, perf_cutoff, silent=Tr
     if min2:
         min2_val, min2_combo = np.inf, []
 
-    total_combinations = int(math.factorial(n) / math.factorial(m) / math.factorial(n-m))
+    n = len(members)
+    total_combinations = csen.combination_count(n, m)
     start_time = time.time()
 
     for i, combo in enumerate(itertools.combinations(range(len(members)), m)):
@@ -323,71 +987,190 @@ def get_best_m_models(perf, dist, change, m, alpha, beta, perf_cutoff, silent=Tr
             eta = (1-percent) * (time.time() - start_time) / percent
             print(f"{100*percent:>4.1f}% / eta in {eta/60:.1f} min / best score {minX_val:.3f}")
             print(f"{', '.join(minX_members )}")
+    return minX_val, minX_combo
 
-    if not silent:
-        print(f"all {total_combinations} combinations tested, which took {(time.time() - start_time)/60:.1f} min")
-        print(f"min val (alpha={alpha}): {minX_val}")
-        print(f"min members:")
-        for index, member in zip(minX_combo, minX_members):
-            distances = [f"{dist[index, i].data:>6.2f}" for i in minX_combo]
-            spreads = [f"{change[index, i].data:>6.2f}" for i in minX_combo]
-            print(f" * {member:>24}   perf: {perf[index].data:>6.2f} dist: {' '.join(distances)} spread: {' '.join(spreads)}") # avr_dist: {avr_dist[index].data:>6.2f}
-    return minX_val, minX_members
-
-# creates csv in parallel (when multiple cores are available)
-def multi_parallel_run(m, cmip, im_or_em, season_region, alpha_steps, beta_steps, perf_cutoff, data, max_workers, min2=False):
+# creates csv in parallel (when multiple cores are available, see parallel_scan_results)
+def multi_parallel_run(m, cmip, im_or_em, season_region, alpha_steps, beta_steps, perf_cutoff, data, max_workers, options=None, hull_index=None, **changes):
+    # every grid point is searched by one process
+    options = search_options(options, **changes)._replace(max_workers=1)
+    if options.scan in ['joint', 'hull', 'adaptive']:
+        # a single enumeration (or hull, or refinement) serves all grid points, there is nothing to distribute
+        return multi_run(m, cmip, im_or_em, season_region, alpha_steps, beta_steps, perf_cutoff, data, options, hull_index=hull_index)
+    elif options.scan != 'pointwise':
+        raise NotImplementedError(options.scan)
     print(f'running with {max_workers} workers.')
-    min2_text=""
-    if min2:
-        min2_text='min2_'
-    single_run_subdir = cmip+'_'+season_region+'_'+min2_text+im_or_em
+    k, epsilon, ranked = ranking(options.min2, options.top_k, options.epsilon)
+    min2_text = scan_label(options)
     filename=Path(cmip+'_'+im_or_em+'_'+season_region+'_'+min2_text+'alpha-beta-scan.csv')
-    if filename.exists():
-        raise RuntimeError('file exists!')
-
-    single_run_res = filename.parent / "single_run_res"
-    futures = []
-    with ProcessPoolExecutor(max_workers=max_workers) as pool:
-        for alpha_idx in range(0,alpha_steps+1):
-            for beta_idx in range(0,beta_steps+1):
-                alpha = alpha_idx/alpha_steps
-                beta = beta_idx/beta_steps
-                if alpha + beta > 1:
-                    continue
-                single_run_file = single_run_res / single_run_subdir / str(m) / str(alpha) / f'{beta}.csv'
-                single_run_file.parent.mkdir(parents=True, exist_ok=True)
-                if single_run_file.exists():
-                    continue
-                future = pool.submit(single_run_with_save, single_run_file, m, alpha, beta, perf_cutoff, data, silent=True, min2=min2)
-                futures.append(future)
-                print(f'submitted {alpha_idx}/{beta_idx}')
-
-    for i, future in enumerate(futures):
-        future.result()
-        print('Progress', i, len(futures))
-
+    if options.journal:
+        # the results are appended in this process as the workers return them
+        filename = filename.with_suffix('.nc')
+        keys = selection_keys(data, m, alpha_beta_grid(alpha_steps, beta_steps), perf_cutoff, options)
+        known, record = scan_journal(filename, m, keys, ranked, perf_cutoff, data, options)
+        parallel_scan_results(m, alpha_steps, beta_steps, perf_cutoff, data, max_workers, options, known=known, done=record, silent=False)
+        return filename
+    check_scan_file(filename, options.result_cache)
+    results = parallel_scan_results(m, alpha_steps, beta_steps, perf_cutoff, data, max_workers, options, silent=False)
+    gaps = selection_gaps(results, m, perf_cutoff, data, options)
     with open(filename, 'w', newline='') as f:
         writer = csv.writer(f)
-        writer.writerow(['alpha','beta','min_val']+[f'member{i}' for i in range(m)])
-        for alpha_idx in range(0,alpha_steps+1):
-            for beta_idx in range(0,beta_steps+1):
-                alpha = alpha_idx/alpha_steps
-                beta = beta_idx/beta_steps
-                if alpha + beta > 1:
-                    continue
-                single_run_file = single_run_res / single_run_subdir / str(m) / str(alpha) / f'{beta}.csv'
-                with open(single_run_file, 'r') as f2:
-                    for row in csv.reader(f2):
-                        print(row)
-                        writer.writerow(row)
+        writer.writerow(scan_header(m, ranked)+['gap'])
+        for alpha, beta in alpha_beta_grid(alpha_steps, beta_steps):
+            for row in scan_rows(alpha, beta, results[(alpha, beta)], ranked):
+                row = row+[gaps[(alpha, beta)]['gap']]
+                print(row)
+                writer.writerow(row)
     return filename
 
-# saves as an intermidiate step when running in parallel
-def single_run_with_save(filename, m, alpha, beta, perf_cutoff, data, silent=False, min2=False):
-    min_val, min_member = single_run(m, alpha, beta, perf_cutoff, data, silent=True, min2=min2)
+# results of the pointwise scan, {(alpha, beta): result of single_run}, with the grid points shared by
+# max_workers processes (see shared_pool_map); grid points found in result_cache are not solved again,
+# and every solved one is stored as soon as it completes, so an interrupted scan resumes from there;
+# known and done as in scan_results
+def parallel_scan_results(m, alpha_steps, beta_steps, perf_cutoff, data, max_workers, options=None, known=None, done=None, silent=True, **changes):
+    options = search_options(options, **changes)._replace(max_workers=1)
+    grid = alpha_beta_grid(alpha_steps, beta_steps)
+    keys = selection_keys(data, m, grid, perf_cutoff, options)
+    results = dict(known or {})
+    cached = csrc.lookup(options.result_cache, [key for point, key in keys.items() if point not in results])
+    for point, key in keys.items():
+        if key in cached and point not in results:
+            results[point] = cached[key]
+            if done is not None:
+                done(point, cached[key])
+    # the workers map the metrics once from shared memory, a task is only (alpha, beta, m, perf_cutoff)
+    def completed(args, result):
+        csrc.store(options.result_cache, {keys[args[:2]]: result})
+        if done is not None:
+            done(args[:2], result)
+    tasks = shared_pool_map(data, max_workers, options, shared_single_run, [(alpha, beta, m, perf_cutoff) for alpha, beta in grid if (alpha, beta) not in results], silent=silent, done=completed)
+    results.update({(alpha, beta): result for (alpha, beta, _, _), result in tasks.items()})
+    return results
+
+# creates one csv for all subset sizes in m_range, indexed by m, alpha and beta (rows of the smaller
+# sizes leave the last member columns empty); every grid point solves all sizes together (see
+# get_best_models_m_range), max_workers processes share the grid points (parallel 'grid') or the
+# combinations of every search (parallel 'ranks'); pointwise scan only
+def multi_m_run(m_range, cmip, im_or_em, season_region, alpha_steps, beta_steps, perf_cutoff, data, options=None, **changes):
+    options = search_options(options, **changes)
+    max_workers, parallel = options.max_workers, options.parallel
+    m_range = sorted(m_range)
+    k, epsilon, ranked = ranking(options.min2, options.top_k, options.epsilon)
+    min2_text = scan_label(options)
+    filename=Path(cmip+'_'+im_or_em+'_'+season_region+'_'+min2_text+m_range_label(m_range)+'alpha-beta-scan.csv')
+    check_scan_file(filename, options.result_cache)
+    grid = alpha_beta_grid(alpha_steps, beta_steps)
+    # every grid point's searches use one process (parallel 'grid') or the max_workers (parallel 'ranks')
+    point_options = options._replace(max_workers=max_workers if parallel == 'ranks' else 1)
+    # grid points with the results of all sizes in result_cache are not solved again
+    keys = {m: selection_keys(data, m, grid, perf_cutoff, point_options) for m in m_range}
+    cached = csrc.lookup(options.result_cache, [key for m in m_range for key in keys[m].values()])
+    results = {point: {m: cached[keys[m][point]] for m in m_range} for point in grid if all(keys[m][point] in cached for m in m_range)}
+    def completed(point, result):
+        csrc.store(options.result_cache, {keys[m][point]: result[m] for m in m_range})
+    if max_workers > 1 and parallel == 'grid':
+        print(f'running with {max_workers} workers.')
+        tasks = shared_pool_map(data, max_workers, point_options, shared_m_range_run, [(alpha, beta, tuple(m_range), perf_cutoff) for alpha, beta in grid if (alpha, beta) not in results],
+                                silent=False, done=lambda args, result: completed(args[:2], result))
+        results.update({(alpha, beta): result for (alpha, beta, _, _), result in tasks.items()})
+    elif max_workers == 1 or parallel == 'ranks':
+        perf, dist, change = metric_arrays(data)
+        incumbent = None
+        for alpha, beta in grid:
+            if (alpha, beta) in results:
+                continue
+            # the previous grid point's optimum of the smallest size seeds this one's
+            results[(alpha, beta)] = get_best_models_m_range(perf, dist, change, m_range, alpha, beta, perf_cutoff, point_options, incumbent=incumbent)
+            completed((alpha, beta), results[(alpha, beta)])
+            min_val, min_member = results[(alpha, beta)][m_range[0]]
+            incumbent = min_member[0] if ranked and len(min_member) else min_member
+    else:
+        raise NotImplementedError(parallel)
     with open(filename, 'w', newline='') as f:
         writer = csv.writer(f)
-        writer.writerow([alpha,beta,min_val]+min_member)
+        writer.writerow(['m']+scan_header(m_range[-1], ranked)+['gap'])
+        for m in m_range:
+            gaps = selection_gaps({point: result[m] for point, result in results.items()}, m, perf_cutoff, data, point_options)
+            for alpha, beta in grid:
+                for row in scan_rows(alpha, beta, results[(alpha, beta)][m], ranked):
+                    print(m, row)
+                    writer.writerow([m]+row+['']*(m_range[-1]-m)+[gaps[(alpha, beta)]['gap']])
+    return filename
+
+# label of the sizes of a multi_m_run output file, e.g. m2-8_ (or m2,4,8_ for gaps)
+def m_range_label(m_range):
+    m_range = sorted(m_range)
+    if m_range == list(range(m_range[0], m_range[-1]+1)):
+        return f'm{m_range[0]}-{m_range[-1]}_'
+    return 'm'+','.join(str(m) for m in m_range)+'_'
+
+# copies delta_q, delta_i and change into one shared memory block (float64);
+# returns the block, the (shape, offset) of each array and their coordinates
+def share_metrics(data):
+    metrics = metric_arrays(data)
+    arrays = [np.ascontiguousarray(metric.data, dtype=np.float64) for metric in metrics]
+    shm = shared_memory.SharedMemory(create=True, size=sum(array.nbytes for array in arrays))
+    layout = []
+    offset = 0
+    for array in arrays:
+        np.ndarray(array.shape, dtype=np.float64, buffer=shm.buf, offset=offset)[...] = array
+        layout.append((array.shape, offset))
+        offset += array.nbytes
+    coords = [{dim: list(metric.coords[dim].data) for dim in metric.dims} for metric in metrics]
+    return shm, layout, coords
+
+# state of a shared-memory pool worker: the attached block, the metrics and the run options
+_shared_worker = None
+
+# pool initializer, maps the metrics of share_metrics (without copying) once per worker
+def init_shared_worker(name, layout, coords, options):
+    global _shared_worker
+    shm = shared_memory.SharedMemory(name=name)
+    metrics = []
+    for (shape, offset), coord in zip(layout, coords):
+        array = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, offset=offset)
+        array.flags.writeable = False
+        metrics.append(xr.DataArray(array, dims=list(coord), coords=coord))
+    _shared_worker = (shm, metrics, options)
+
+# single_run in a worker of init_shared_worker
+def shared_single_run(alpha, beta, m, perf_cutoff):
+    shm, (perf, dist, change), options = _shared_worker
+    checkpoint = checkpoint_file(options.checkpoint_dir, m, alpha, beta, perf_cutoff)
+    return get_best_m_models(perf, dist, change, m, alpha, beta, perf_cutoff, silent=True, options=options, checkpoint=checkpoint)
+
+# task(*args) for every args in args_list, run by max_workers workers of init_shared_worker
+# (the metrics of data in shared memory, the run options of every task); {args: result}
+# done(args, result) is called as soon as a task completes
+def shared_pool_map(data, max_workers, options, task, args_list, silent=True, done=None):
+    shm, layout, coords = share_metrics(data)
+    results = {}
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_shared_worker, initargs=(shm.name, layout, coords, options)) as pool:
+            futures = {pool.submit(task, *args): args for args in args_list}
+            for i, future in enumerate(as_completed(futures)):
+                results[futures[future]] = future.result()
+                if done is not None:
+                    done(futures[future], results[futures[future]])
+                if not silent:
+                    print('Progress', i, len(futures))
+    finally:
+        shm.close()
+        shm.unlink()
+    return results
+
+# get_best_models_m_range in a worker of init_shared_worker
+def shared_m_range_run(alpha, beta, m_range, perf_cutoff):
+    shm, (perf, dist, change), options = _shared_worker
+    return get_best_models_m_range(perf, dist, change, m_range, alpha, beta, perf_cutoff, options)
+
+# checkpoint of the enumeration of one grid point in checkpoint_dir (None without a directory);
+# the file also records a hash of the inputs, so a stale checkpoint is never resumed
+def checkpoint_file(checkpoint_dir, m, alpha, beta, perf_cutoff):
+    if checkpoint_dir is None:
+        return None
+    checkpoint_dir = Path(checkpoint_dir)
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    return checkpoint_dir / f'm{m}_cutoff{perf_cutoff}_alpha{alpha}_beta{beta}.npz'
 
 # ################################
 # Make output files
@@ -405,9 +1188,101 @@ def make_output_file(dsDeltaQ,ds_spread_metric,targets,dsWi,outfile='perf_ind_sp
     dsWi['pr_change'] = targets[1]
     dsWi.to_netcdf(outfile)
 
-def select_models(outfile, cmip, im_or_em, season_region, m, alpha_steps, beta_steps, perf_cutoff,max_workers=1, min2=False):
+# options: the fields of SearchOptions (solver, scan, top_k, epsilon, ...), among them
+# parallel: 'grid' distributes the alpha-beta grid points over max_workers processes,
+#           'ranks' splits the combinations of every grid point over them (for few points and large m)
+# checkpoint_dir: directory for the periodic checkpoints of long enumerations (solver 'numpy')
+# time_budget: seconds per grid point of solver 'anneal'
+# precision: 'float32' enumerates in float32 with exact float64 re-scoring (solvers numpy and numba, same result)
+# constraints: dict(max_per_family=..., include=[...], exclude=[...]), at most max_per_family members of
+#              one model family (get_model_base), members every subset contains / never contains
+# m_range: subset sizes selected in one run instead of m, written to one csv (see multi_m_run)
+# result_cache: SQLite file of the results of earlier runs (see result_cache.py), None (default) to always solve
+# pareto_front: also writes the Pareto front of every subset size next to the scan csv (see pareto_run)
+# journal: appends the results to a netCDF journal (alpha-beta-scan.nc, see journal.py) instead of the csv,
+#          a restarted scan skips the grid points already in it
+def select_models(outfile, cmip, im_or_em, season_region, m, alpha_steps, beta_steps, perf_cutoff,max_workers=1, min2=False, m_range=None, pareto_front=False, **options):
+    options = SearchOptions(max_workers=max_workers, min2=min2, **options)
     data = xr.open_dataset(outfile,use_cftime = True)
-    if max_workers==1:
-        return multi_run(m, cmip, im_or_em, season_region, alpha_steps, beta_steps, perf_cutoff, data, min2=min2)
+    if pareto_front:
+        for size in (m_range if m_range is not None else [m]):
+            pareto_run(size, cmip, im_or_em, season_region, perf_cutoff, data)
+    if m_range is not None:
+        if options.scan != 'pointwise':
+            raise ValueError(f"m_range supports scan='pointwise' only, not scan='{options.scan}'")
+        if options.journal:
+            raise ValueError('m_range writes a csv, a journal holds one subset size')
+        return multi_m_run(m_range, cmip, im_or_em, season_region, alpha_steps, beta_steps, perf_cutoff, data, options)
+    hull_index = None
+    if options.scan == 'hull' and not min2 and options.top_k is None and options.epsilon is None:
+        hull_index = get_hull_index(outfile, m, perf_cutoff)
+    if max_workers==1 or options.parallel == 'ranks':
+        return multi_run(m, cmip, im_or_em, season_region, alpha_steps, beta_steps, perf_cutoff, data, options, hull_index=hull_index)
+    elif options.parallel != 'grid':
+        raise NotImplementedError(options.parallel)
+    else:
+        return multi_parallel_run(m, cmip, im_or_em, season_region, alpha_steps, beta_steps, perf_cutoff, data, max_workers, options, hull_index=hull_index)
+
+# ################################
+# In-memory selection
+# ################################
+
+# metrics Dataset of make_output_file from in-memory arrays: delta_q (n,), delta_i and change (n, n),
+# optionally the targets tas_change and pr_change (n,) of spread_scatter
+def metrics_dataset(delta_q, delta_i, change, members, tas_change=None, pr_change=None):
+    members = list(members)
+    data = xr.Dataset(dict(delta_q=(['member'], np.asarray(delta_q)),
+                           delta_i=(['member', 'member_model'], np.asarray(delta_i)),
+                           change=(['member', 'member_model'], np.asarray(change))),
+                      coords=dict(member=members, member_model=members))
+    if tas_change is not None:
+        data['tas_change'] = (['member'], np.asarray(tas_change))
+    if pr_change is not None:
+        data['pr_change'] = (['member'], np.asarray(pr_change))
+    return data
+
+# Dataset of the results of a scan ({(alpha, beta): result of single_run}), indexed by alpha, beta and
+# rank (the ranked subsets of top_k / epsilon, else only rank 0) with the costs (cost) and the member
+# ids (members, along position); grid points outside the triangle and missing ranks hold NaN and '';
+# gaps ({(alpha, beta): dict(bound, gap)} of selection_gaps) add the variables bound and gap (alpha, beta)
+def selection_dataset(results, m, ranked, gaps=None, **attrs):
+    alphas = sorted(set(alpha for alpha, beta in results))
+    betas = sorted(set(beta for alpha, beta in results))
+    rows = {point: scan_rows(*point, result, ranked) for point, result in results.items()}
+    nrank = max([len(point_rows) for point_rows in rows.values()], default=0)
+    cost = np.full((len(alphas), len(betas), max(nrank, 1)), np.nan)
+    members = np.full((len(alphas), len(betas), max(nrank, 1), m), '', dtype=object)
+    for (alpha, beta), point_rows in rows.items():
+        for rank, row in enumerate(point_rows):
+            row = row[3:] if ranked else row[2:]
+            cost[alphas.index(alpha), betas.index(beta), rank] = row[0]
+            members[alphas.index(alpha), betas.index(beta), rank, :len(row)-1] = [str(member) for member in row[1:]]
+    attrs = {key: int(value) if isinstance(value, bool) else value for key, value in attrs.items() if value is not None}
+    selection = xr.Dataset(dict(cost=(['alpha', 'beta', 'rank'], cost),
+                                members=(['alpha', 'beta', 'rank', 'position'], members)),
+                           coords=dict(alpha=alphas, beta=betas, rank=np.arange(max(nrank, 1))),
+                           attrs=dict(m=m, **attrs))
+    if gaps is not None:
+        for name in ['bound', 'gap']:
+            values = np.full((len(alphas), len(betas)), np.nan)
+            for (alpha, beta), certificate in gaps.items():
+                values[alphas.index(alpha), betas.index(beta)] = certificate[name]
+            selection[name] = (['alpha', 'beta'], values)
+    return selection
+
+# selection without files: data is the metrics Dataset (e.g. an opened outfile or metrics_dataset),
+# the options are those of select_models (max_workers processes share the grid points), and the
+# result is the Dataset of selection_dataset (with the bound and gap of every grid point), which
+# selection_triangle plots directly
+def select(data, m, alpha_steps=10, beta_steps=10, perf_cutoff=10, max_workers=1, min2=False, hull_index=None, **options):
+    options = SearchOptions(max_workers=max_workers, min2=min2, **options)
+    k, epsilon, ranked = ranking(min2, options.top_k, options.epsilon)
+    if max_workers > 1 and options.scan == 'pointwise' and options.parallel == 'grid':
+        results = parallel_scan_results(m, alpha_steps, beta_steps, perf_cutoff, data, max_workers, options)
+        options = options._replace(max_workers=1)
     else:
-        return multi_parallel_run(m, cmip, im_or_em, season_region, alpha_steps, beta_steps, perf_cutoff, data, max_workers, min2=min2)
+        # one process, or the combinations of every search split over max_workers (parallel 'ranks')
+        options = options._replace(max_workers=max_workers if options.parallel == 'ranks' else 1)
+        results = scan_results(m, alpha_steps, beta_steps, perf_cutoff, data, options, hull_index=hull_index)
+    gaps = selection_gaps(results, m, perf_cutoff, data, options)
+    return selection_dataset(results, m, ranked, gaps=gaps, perf_cutoff=perf_cutoff, solver=options.solver, scan=options.scan, min2=min2, top_k=options.top_k, epsilon=options.epsilon)
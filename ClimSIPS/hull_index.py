@@ -0,0 +1,109 @@
+#################################
+# packages
+#################################
+
+import xarray as xr
+import numpy as np
+
+import time
+from pathlib import Path
+from collections import namedtuple
+
+from scipy.spatial import ConvexHull
+from scipy.spatial import QhullError
+
+from . import enumeration as csen
+
+##################################################################
+# convex-hull index of the subset component sums
+##################################################################
+
+# The cost of a subset is linear in its performance, independence and spread sums (P, D, C):
+# cost = (1-alpha-beta) * P - alpha * D - beta * C. For every alpha and beta, the minimum over
+# all subsets is therefore reached at a vertex of the convex hull of the (P, D, C) points, and
+# that hull only has to be built once per (metrics, m, perf_cutoff).
+
+# hull vertices (and points within qhull's precision of a facet) among the given points
+def hull_points(points):
+    if len(points) < 5:
+        return np.arange(len(points))
+    try:
+        hull = ConvexHull(points, qhull_options='Qc')
+    except QhullError:
+        # flat or degenerate point sets, keep everything
+        return np.arange(len(points))
+    return np.unique(np.concatenate([hull.vertices, hull.coplanar[:, 0]]))
+
+# streams over all n choose m subsets and keeps the points of the convex hull of their
+# component sums; perf, dist and change are the normalized matrices of norm_matrices
+def build_hull_index(perf, dist, change, m, members, rows=None, silent=True):
+    perf, dist, change = [np.ascontiguousarray(a, dtype=np.float64) for a in (perf, dist, change)]
+    n = len(perf)
+    total = csen.combination_count(n, m)
+    comps = np.empty((0, 3))
+    ranks = np.empty(0, dtype=np.int64)
+    combos = np.empty((0, m), dtype=np.intp)
+    start_time = time.time()
+    for start, block in csen.combination_blocks(n, m, rows):
+        block_comps = np.stack([csen.score_combinations(a, block) for a in (perf, dist, change)], axis=1)
+        comps = np.concatenate([comps, block_comps])
+        ranks = np.concatenate([ranks, np.arange(start, start+len(block), dtype=np.int64)])
+        combos = np.concatenate([combos, block])
+        keep = hull_points(comps)
+        comps, ranks, combos = comps[keep], ranks[keep], combos[keep]
+        if not silent:
+            percent = (start+len(block)) / total
+            eta = (1-percent) * (time.time() - start_time) / percent
+            print(f"{100*percent:>4.1f}% / eta in {eta/60:.1f} min / {len(comps)} hull points")
+
+    return xr.Dataset(
+        dict(components=(['vertex', 'component'], comps),
+             combo_rank=(['vertex'], ranks),
+             combo=(['vertex', 'slot'], combos),
+             norm_perf=(['member', 'member_model'], perf),
+             norm_dist=(['member', 'member_model'], dist),
+             norm_change=(['member', 'member_model'], change)),
+        coords=dict(component=['perf', 'dist', 'change'], member=list(members), member_model=list(members)),
+        attrs=dict(m=m))
+
+# plain arrays of a hull index for fast repeated queries
+HullLookup = namedtuple('HullLookup', ['components', 'combo_rank', 'combo', 'norm_perf', 'norm_dist', 'norm_change', 'members', 'slack'])
+
+def hull_lookup(index):
+    comps = index.components.data
+    # the weighted sums round differently than the cost matrix sum, near-optimal vertices are re-scored
+    slack = csen.SLACK * csen.cost_scale(comps, index.attrs['m'])
+    return HullLookup(comps, index.combo_rank.data, index.combo.data, index.norm_perf.data,
+                      index.norm_dist.data, index.norm_change.data, list(index.member.data), slack)
+
+# minimizing subset for any (also non-grid) alpha and beta from the hull index (or its hull_lookup);
+# returns the same min_val and members as single_run
+def hull_single_run(index, alpha, beta):
+    if not isinstance(index, HullLookup):
+        index = hull_lookup(index)
+    approx = index.components @ np.array([1-alpha-beta, -alpha, -beta])
+    near = np.flatnonzero(approx <= approx.min() + index.slack)
+    combos = index.combo[near]
+    # exact cost of the candidates, entries computed as in cost_matrix
+    rows, cols = combos[:, :, None], combos[:, None, :]
+    cost = (1-alpha-beta) * index.norm_perf[rows, cols] - alpha * index.norm_dist[rows, cols] - beta * index.norm_change[rows, cols]
+    vals = cost.reshape(len(combos), -1).sum(axis=1)
+    best = np.lexsort((index.combo_rank[near], vals))[0]
+    return vals[best], [index.members[i] for i in combos[best]]
+
+# {(alpha, beta): (min_val, members)} for a whole grid, see joint_scan
+def hull_scan(index, grid):
+    lookup = hull_lookup(index)
+    return {(alpha, beta): hull_single_run(lookup, alpha, beta) for alpha, beta in grid}
+
+# file next to the metrics file holding the hull index of (m, perf_cutoff)
+def hull_index_file(outfile, m, perf_cutoff):
+    outfile = Path(outfile)
+    return outfile.with_name(f'{outfile.stem}_hull_m{m}_cutoff{perf_cutoff}.nc')
+
+def save_hull_index(index, filename):
+    index.to_netcdf(filename)
+
+def load_hull_index(filename):
+    with xr.open_dataset(filename) as index:
+        return index.load()
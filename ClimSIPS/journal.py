@@ -0,0 +1,101 @@
+#################################
+# packages
+#################################
+
+import xarray as xr
+import numpy as np
+
+import netCDF4
+from pathlib import Path
+
+##################################################################
+# append-only journal of scan results
+##################################################################
+
+# The results of a scan are appended to one netCDF file along the unlimited dimension entry as the
+# grid points complete, one entry per (grid point, rank) with the selection key of the grid point
+# (see function.selection_key), alpha, beta, rank, cost, gap and the members (entry, position).
+# A restarted scan skips the grid points whose key is already present; the file is opened for
+# every append and closed (flushed) afterwards, and only the process running the scan writes it.
+
+def create(path, m):
+    with netCDF4.Dataset(path, 'w') as journal:
+        journal.createDimension('entry', None)
+        journal.createDimension('position', m)
+        journal.createVariable('key', str, ('entry',))
+        for name in ['alpha', 'beta', 'cost', 'gap']:
+            journal.createVariable(name, 'f8', ('entry',))
+        journal.createVariable('rank', 'i4', ('entry',))
+        journal.createVariable('members', str, ('entry', 'position'))
+        journal.setncattr('m', m)
+
+# keys of the grid points in the journal (empty if it does not exist)
+def journal_keys(path):
+    if not Path(path).exists():
+        return set()
+    with netCDF4.Dataset(path, 'r') as journal:
+        return set(journal['key'][:].tolist())
+
+# {key: result of single_run} of the given keys present in the journal
+# (ranked: (vals, [members, ...]) in rank order, else (min_val, members))
+def lookup(path, keys, ranked):
+    keys = set(keys)
+    if not Path(path).exists() or not keys:
+        return {}
+    with netCDF4.Dataset(path, 'r') as journal:
+        entry_keys = journal['key'][:].tolist()
+        rows = [i for i, key in enumerate(entry_keys) if key in keys]
+        cost = journal['cost'][:].filled(np.nan)[rows] if rows else []
+        rank = journal['rank'][:][rows] if rows else []
+        members = journal['members'][rows, :] if rows else []
+    found = {}
+    for i, row in enumerate(rows):
+        found.setdefault(entry_keys[row], []).append((int(rank[i]), float(cost[i]), [str(member) for member in members[i] if member]))
+    results = {}
+    for key, entries in found.items():
+        entries.sort()
+        if ranked:
+            entries = [entry for entry in entries if entry[2]]
+            results[key] = (np.array([cost for _, cost, _ in entries], dtype=np.float64), [subset for _, _, subset in entries])
+        else:
+            results[key] = (np.float64(entries[0][1]), entries[0][2])
+    return results
+
+# appends the results {key: (alpha, beta, result, gap)} (see lookup for the results) in one write;
+# a ranked result without subsets is kept as one entry without members, so that it is not solved again
+def append(path, m, results):
+    if not results:
+        return
+    if not Path(path).exists():
+        create(path, m)
+    keys, alphas, betas, ranks, costs, gaps, members = [], [], [], [], [], [], []
+    for key, (alpha, beta, (vals, subsets), gap) in results.items():
+        if not np.ndim(vals):
+            vals, subsets = [vals], [subsets]
+        elif not len(vals):
+            vals, subsets = [np.inf], [[]]
+        for rank, (val, subset) in enumerate(zip(vals, subsets)):
+            keys.append(key)
+            alphas.append(alpha)
+            betas.append(beta)
+            ranks.append(rank)
+            costs.append(val)
+            gaps.append(gap)
+            members.append([str(member) for member in subset] + ['']*(m-len(subset)))
+    with netCDF4.Dataset(path, 'a') as journal:
+        if journal.getncattr('m') != m:
+            raise ValueError(f"journal {path} holds subsets of m={journal.getncattr('m')}, not m={m}")
+        start = len(journal.dimensions['entry'])
+        stop = start + len(keys)
+        journal['key'][start:stop] = np.array(keys, dtype=object)
+        journal['alpha'][start:stop] = alphas
+        journal['beta'][start:stop] = betas
+        journal['rank'][start:stop] = ranks
+        journal['cost'][start:stop] = costs
+        journal['gap'][start:stop] = gaps
+        journal['members'][start:stop, :] = np.array(members, dtype=object).reshape(len(keys), m)
+
+# the journal as a Dataset (variables of entry and position)
+def load(path):
+    with xr.open_dataset(path, engine='netcdf4') as journal:
+        return journal.load()
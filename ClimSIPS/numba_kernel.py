@@ -0,0 +1,142 @@
+#################################
+# packages
+#################################
+
+import numpy as np
+
+import os
+import math
+
+from . import enumeration as csen
+
+try:
+    import numba
+    from numba import njit, prange
+except ImportError:
+    numba = None
+
+# The worker pools of function.py and enumeration.py fork this process, which the TBB and OpenMP
+# threading layers do not survive (the process hangs at exit, or forked workers running the kernel
+# crash). The workqueue layer is fork-safe; it does not allow kernels launched from concurrent
+# threads, which the selection server avoids (it searches with numpy, see get_best_m_models).
+# The layer is set when the kernel first runs, not on import, and numba fixes it at the first parallel
+# launch of the process, so it applies to all numba code once solver 'numba' has been used (and
+# not if other parallel numba code ran before). NUMBA_THREADING_LAYER takes precedence.
+def use_workqueue():
+    if 'NUMBA_THREADING_LAYER' not in os.environ:
+        numba.config.THREADING_LAYER = 'workqueue'
+
+##################################################################
+# optional numba-compiled enumeration kernel
+##################################################################
+
+# The kernel walks contiguous chunks of lexicographic ranks in parallel (prange), each from its
+# unranked first combination through the lexicographic successors. The cost of the prefixes
+# c_0 ... c_t is kept, so a successor only re-sums the positions that changed (O(m) on average).
+# Every chunk keeps its cap lowest costs in a small buffer; these incrementally summed costs are
+# re-scored exactly with score_combinations, so the selection is identical to best_subsets. A chunk
+# whose buffer is filled with costs within slack of its selection limit is re-run with the numpy path.
+# With precision 'float32' the kernel sums in float32 (compiled separately) and the slack widens to
+# csen.float32_slack.
+
+# combinations per parallel chunk
+CHUNK_SIZE = 2**20
+
+def available():
+    return numba is not None
+
+if numba is not None:
+    @njit(parallel=True, cache=True)
+    def _chunk_best(cost, pair, m, binom, starts, counts, cap, out_vals, out_ranks, out_counts):
+        n = len(cost)
+        for chunk in prange(len(starts)):
+            combo = np.empty(m, dtype=np.int64)
+            prefix = np.zeros(m+1, dtype=cost.dtype)
+            # unrank the first combination of the chunk
+            rest = binom[n, m] - 1 - starts[chunk]
+            for i in range(m):
+                d = n-1
+                while binom[d, m-i] > rest:
+                    d -= 1
+                rest -= binom[d, m-i]
+                combo[i] = n-1-d
+            changed = 0
+            count = 0
+            worst = 0
+            for step in range(counts[chunk]):
+                # re-sum the prefixes from the first changed position
+                for t in range(changed, m):
+                    ct = combo[t]
+                    s = prefix[t] + cost[ct, ct]
+                    for i in range(t):
+                        s += pair[combo[i], ct]
+                    prefix[t+1] = s
+                val = prefix[m]
+                if count < cap:
+                    out_vals[chunk, count] = val
+                    out_ranks[chunk, count] = starts[chunk] + step
+                    count += 1
+                    if count == cap:
+                        for j in range(cap):
+                            if out_vals[chunk, j] > out_vals[chunk, worst]:
+                                worst = j
+                elif val < out_vals[chunk, worst]:
+                    out_vals[chunk, worst] = val
+                    out_ranks[chunk, worst] = starts[chunk] + step
+                    for j in range(cap):
+                        if out_vals[chunk, j] > out_vals[chunk, worst]:
+                            worst = j
+                # lexicographic successor
+                i = m-1
+                while i >= 0 and combo[i] == n-m+i:
+                    i -= 1
+                if i < 0:
+                    break
+                combo[i] += 1
+                for j in range(i+1, m):
+                    combo[j] = combo[j-1] + 1
+                changed = i
+            out_counts[chunk] = count
+
+# best_subsets with the compiled kernel (same selection); cap is the buffer size per chunk
+def best_subsets_numba(cost, m, k=1, epsilon=None, cap=None, chunk_size=CHUNK_SIZE, progress=None, precision='float64'):
+    if numba is None:
+        raise ImportError('numba is not installed')
+    use_workqueue()
+    cost = np.ascontiguousarray(cost, dtype=np.float64)
+    n = len(cost)
+    best = csen.BestSubsets(m, k, epsilon=epsilon)
+    total = csen.combination_count(n, m)
+    if m > n or m == 0:
+        return csen.best_subsets(cost, m, k=k, epsilon=epsilon)
+    if cap is None:
+        cap = max(4*k, 32) if k is not None else 256
+    if precision not in csen.PRECISIONS:
+        raise ValueError(f'precision must be one of {csen.PRECISIONS}, not {precision}')
+    dtype = np.float32 if precision == 'float32' else np.float64
+    slack = csen.SLACK * csen.cost_scale(cost, m)
+    if precision == 'float32':
+        slack = max(slack, csen.float32_slack(cost, m))
+    pair = (cost + cost.T).astype(dtype)
+    binom = np.array([[math.comb(a, b) for b in range(m+1)] for a in range(n+1)], dtype=np.int64)
+    nchunks = max(numba.get_num_threads(), -(-total // chunk_size))
+    bounds = [total * i // nchunks for i in range(nchunks+1)]
+    starts = np.array(bounds[:-1], dtype=np.int64)
+    counts = np.diff(bounds).astype(np.int64)
+    out_vals = np.empty((nchunks, cap), dtype=dtype)
+    out_ranks = np.empty((nchunks, cap), dtype=np.int64)
+    out_counts = np.zeros(nchunks, dtype=np.int64)
+    _chunk_best(cost.astype(dtype), pair, m, binom, starts, counts, cap, out_vals, out_ranks, out_counts)
+
+    for chunk in range(nchunks):
+        vals = out_vals[chunk, :out_counts[chunk]]
+        ranks = out_ranks[chunk, :out_counts[chunk]]
+        if len(vals) == cap and vals.max() <= best.limit(vals) + 2*slack:
+            # more near-ties than the buffer holds
+            best.merge(csen.best_subsets(cost, m, k=k, epsilon=epsilon, first=int(starts[chunk]), last=int(starts[chunk]+counts[chunk]), precision=precision))
+            continue
+        combos = csen.combination_unranks(ranks, n, m)
+        best.offer(csen.score_combinations(cost, combos), ranks, combos)
+    if progress is not None:
+        progress(total, total, best)
+    return best
@@ -0,0 +1,163 @@
+#################################
+# packages
+#################################
+
+import xarray as xr
+import numpy as np
+
+import bisect
+import csv
+import time
+from pathlib import Path
+
+from scipy.optimize import linprog
+
+from . import enumeration as csen
+
+##################################################################
+# Pareto front of the subset component sums
+##################################################################
+
+# A subset with performance, independence and spread sums (P, D, C) is Pareto-optimal if no other
+# subset has a lower or equal P and higher or equal D and C, better in at least one. The weighted
+# cost (1-alpha-beta) * P - alpha * D - beta * C only ever selects the supported part of the front
+# (points of its convex hull); the unsupported subsets between them are optimal trade-offs that no
+# alpha-beta grid point selects. All points are compared as minimized objectives (P, -D, -C).
+
+# threshold levels of the dominance index (see ParetoArchive)
+INDEX_LEVELS = 32
+
+def objectives(comps):
+    return np.asarray(comps) * np.array([1., -1., -1.])
+
+# rows of points (minimized objectives) not dominated by another row, as sorted indices;
+# equal rows are kept together. The unique rows are swept in lexicographic order, every row
+# is only dominated by earlier ones, which are tested with a staircase of their last two columns
+# (first ascending, second strictly descending) in O(log front) per row
+def non_dominated(points):
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) == 0:
+        return np.empty(0, dtype=np.intp)
+    unique, inverse = np.unique(points, axis=0, return_inverse=True)
+    keep = np.zeros(len(unique), dtype=bool)
+    first, second = [], []
+    for i, (_, y, z) in enumerate(unique.tolist()):
+        j = bisect.bisect_right(first, y) - 1
+        if j >= 0 and second[j] <= z:
+            continue
+        keep[i] = True
+        # the staircase entries this row dominates in the last two columns are replaced by it
+        lo = bisect.bisect_left(first, y)
+        hi = lo
+        while hi < len(first) and second[hi] >= z:
+            hi += 1
+        first[lo:hi] = [y]
+        second[lo:hi] = [z]
+    return np.flatnonzero(keep[inverse.reshape(-1)])
+
+# staircase of the last two columns of points, (first ascending, second strictly descending)
+def staircase(points):
+    order = np.lexsort((points[:, 2], points[:, 1]))
+    first, second = points[order, 1], points[order, 2]
+    keep = second < np.minimum.accumulate(np.concatenate([[np.inf], second[:-1]]))
+    return first[keep], second[keep]
+
+# Non-dominated subsets seen so far. Blocks of new subsets are first tested against a dominance
+# index of the archive: for INDEX_LEVELS thresholds t of the first objective, the staircase of all
+# archive points with a first objective <= t. A point above a threshold is dominated if that
+# staircase has a point with lower or equal second and third objectives, found by one binary
+# search (vectorized over the block). Only the few remaining points are merged exactly.
+class ParetoArchive:
+    def __init__(self, m, levels=INDEX_LEVELS):
+        self.m = m
+        self.levels = levels
+        self.points = np.empty((0, 3))
+        self.ranks = np.empty(0, dtype=np.int64)
+        self.combos = np.empty((0, m), dtype=np.intp)
+        self.index = []
+
+    def __len__(self):
+        return len(self.points)
+
+    def build_index(self):
+        if len(self.points) == 0:
+            self.index = []
+            return
+        thresholds = np.unique(np.quantile(self.points[:, 0], np.linspace(0, 1, self.levels)))
+        self.index = [(t, staircase(self.points[self.points[:, 0] <= t])) for t in thresholds]
+
+    # points strictly dominated by the archive (a conservative test, some dominated points pass)
+    def dominated(self, points):
+        dominated = np.zeros(len(points), dtype=bool)
+        thresholds = np.array([t for t, _ in self.index])
+        # the highest threshold strictly below each point's first objective
+        level = np.searchsorted(thresholds, points[:, 0], side='left') - 1
+        for l in np.unique(level[level >= 0]):
+            rows = np.flatnonzero(level == l)
+            first, second = self.index[l][1]
+            j = np.searchsorted(first, points[rows, 1], side='right') - 1
+            dominated[rows] = (j >= 0) & (second[np.maximum(j, 0)] <= points[rows, 2])
+        return dominated
+
+    def offer(self, points, ranks, combos):
+        new = ~self.dominated(points)
+        points = np.concatenate([self.points, points[new]])
+        ranks = np.concatenate([self.ranks, ranks[new]])
+        combos = np.concatenate([self.combos, combos[new]])
+        keep = non_dominated(points)
+        self.points, self.ranks, self.combos = points[keep], ranks[keep], combos[keep]
+        self.build_index()
+
+# whether each front point minimizes the weighted cost for some alpha, beta >= 0, alpha + beta <= 1
+# (within slack); the point i is supported if the linear program over (alpha, beta) of
+#   w . (points[j] - points[i]) >= -slack for all j,   w = (1-alpha-beta, alpha, beta)
+# is feasible
+def supported(points, slack):
+    flags = np.zeros(len(points), dtype=bool)
+    for i, point in enumerate(points):
+        delta = points - point
+        A = -np.stack([delta[:, 1] - delta[:, 0], delta[:, 2] - delta[:, 0]], axis=1)
+        res = linprog(np.zeros(2), A_ub=np.vstack([A, [[1., 1.]]]), b_ub=np.concatenate([delta[:, 0] + slack, [1.]]),
+                      bounds=[(0, None), (0, None)], method='highs')
+        flags[i] = res.status == 0
+    return flags
+
+# streams over all n choose m subsets and keeps the Pareto front of their component sums;
+# perf, dist and change are the normalized matrices of norm_matrices
+def build_pareto_front(perf, dist, change, m, members, rows=None, silent=True):
+    perf, dist, change = [np.ascontiguousarray(a, dtype=np.float64) for a in (perf, dist, change)]
+    n = len(perf)
+    total = csen.combination_count(n, m)
+    archive = ParetoArchive(m)
+    start_time = time.time()
+    for start, block in csen.combination_blocks(n, m, rows):
+        block_comps = np.stack([csen.score_combinations(a, block) for a in (perf, dist, change)], axis=1)
+        archive.offer(objectives(block_comps), np.arange(start, start+len(block), dtype=np.int64), block)
+        if not silent:
+            percent = (start+len(block)) / total
+            eta = (1-percent) * (time.time() - start_time) / percent
+            print(f"{100*percent:>4.1f}% / eta in {eta/60:.1f} min / {len(archive)} front points")
+
+    comps = objectives(archive.points)
+    order = np.lexsort((archive.ranks, comps[:, 0]))
+    comps, ranks, combos = comps[order], archive.ranks[order], archive.combos[order]
+    # the slack of hull_index.hull_lookup
+    slack = csen.SLACK * csen.cost_scale(comps, m)
+    return xr.Dataset(
+        dict(components=(['point', 'component'], comps),
+             supported=(['point'], supported(objectives(comps), slack)),
+             combo_rank=(['point'], ranks),
+             combo=(['point', 'slot'], combos)),
+        coords=dict(component=['perf', 'dist', 'change'], member=list(members)),
+        attrs=dict(m=m))
+
+# csv of the front: component sums, whether a weighted cost selects the subset and its members
+def save_pareto_front(front, filename):
+    members = list(front.member.data)
+    m = front.attrs['m']
+    rows = [['perf', 'dist', 'change', 'supported']+[f'member{i}' for i in range(m)]]
+    for comps, flag, combo in zip(front.components.data, front.supported.data, front.combo.data):
+        rows.append(list(comps)+[int(flag)]+[members[i] for i in combo])
+    with open(filename, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+    return Path(filename)
@@ -22,7 +22,8 @@ def independence_square(outfile,cmip,im_or_em,season_region,plotname="independen
     fig = plt.figure(figsize=(13,10))
     ax = plt.subplot(111)
     ################################################
-    dsWi = xr.open_dataset(outfile,use_cftime = True)
+    # outfile: metrics file or its Dataset (e.g. function.metrics_dataset)
+    dsWi = outfile if isinstance(outfile, xr.Dataset) else xr.open_dataset(outfile,use_cftime = True)
 
     # puts models in paper index order (TO DO: generalize)
     if cmip == 'CMIP6' and len(dsWi.delta_i) == 34:
@@ -21,7 +21,8 @@ def performance_order(outfile,cmip,im_or_em,season_region,plotname="performance_
     fig = plt.figure(figsize=(8,4))
     ax = plt.subplot(111)
     ################################################
-    dsWi = xr.open_dataset(outfile,use_cftime = True)
+    # outfile: metrics file or its Dataset (e.g. function.metrics_dataset)
+    dsWi = outfile if isinstance(outfile, xr.Dataset) else xr.open_dataset(outfile,use_cftime = True)
 
     dsWi = dsWi.assign_coords({"perf": ("member", dsWi.delta_q.data)})
     dsWi_sort = dsWi.sortby(['perf'],ascending=True)
@@ -22,18 +22,51 @@ def shannon_entropy(p):
             continue
     return -1.*s
 
-def selection_triangle(optimal_models_csv,no_of_steps,plotname="optimal_subsets.png"):
+# rows of the best subsets (rank 0) of a Dataset of function.select, as read from the scan csv
+def dataset_rows(selection):
+    rows = []
+    for alpha in selection.alpha.data:
+        for beta in selection.beta.data:
+            point = selection.sel(alpha=alpha, beta=beta, rank=0)
+            if np.isnan(point.cost):
+                continue
+            rows.append(dict(alpha=alpha, beta=beta, min_val=float(point.cost),
+                             **{f'member{i}': str(member) for i, member in enumerate(point.members.data)}))
+    return rows
+
+# rows of the best subsets (rank 0) of a scan journal (see ClimSIPS/journal.py)
+def journal_rows(filename):
+    with xr.open_dataset(filename, engine='netcdf4') as journal:
+        journal = journal.load()
+    rows = []
+    for entry in np.flatnonzero((journal['rank'].data == 0) & np.isfinite(journal.cost.data)):
+        rows.append(dict(alpha=float(journal.alpha[entry]), beta=float(journal.beta[entry]), min_val=float(journal.cost[entry]),
+                         **{f'member{i}': str(member) for i, member in enumerate(journal.members.data[entry])}))
+    return rows
+
+# optimal_models_csv: scan csv or journal (.nc) of select_models or Dataset of function.select
+def selection_triangle(optimal_models_csv,no_of_steps,plotname="optimal_subsets.png",m=None):
     filename = optimal_models_csv
 
-    with open(filename, 'r') as f:
-        reader = csv.DictReader(f)
-        data = []
-        for d in reader:
-            d['alpha'] = np.round(float(d['alpha']), 3)
-            d['beta'] = np.round(float(d['beta']), 3)
-            nr_mem = len(d)-3
-            d['models_str'] = ', '.join(sorted([d[f'member{i}'] for i in range(nr_mem)]))
-            data.append(d)
+    if isinstance(optimal_models_csv, xr.Dataset):
+        rows = dataset_rows(optimal_models_csv)
+    elif str(filename).endswith('.nc'):
+        rows = journal_rows(filename)
+    else:
+        with open(filename, 'r') as f:
+            rows = list(csv.DictReader(f))
+    data = []
+    for d in rows:
+        # top_k / epsilon scans list several subsets per grid point, the triangle shows the best
+        if d.get('rank', '0') != '0':
+            continue
+        # m_range scans list several subset sizes, the triangle shows size m
+        if m is not None and 'm' in d and d['m'] != str(m):
+            continue
+        d['alpha'] = np.round(float(d['alpha']), 3)
+        d['beta'] = np.round(float(d['beta']), 3)
+        d['models_str'] = ', '.join(sorted([v for key, v in d.items() if key.startswith('member') and v]))
+        data.append(d)
 # generalize d of member
     alphas = list(sorted(list(set([d['alpha'] for d in data]))))
     betas = list(sorted(list(set([d['beta'] for d in data]))))
@@ -24,7 +24,8 @@ def spread_scatter(outfile,cmip,im_or_em,season_region,plotname="spread_scatter.
     fig = plt.figure(figsize=(9,7))
     ax = plt.subplot(111)
     # ################################################
-    dsWi = xr.open_dataset(outfile,use_cftime = True)
+    # outfile: metrics file or its Dataset (e.g. function.metrics_dataset)
+    dsWi = outfile if isinstance(outfile, xr.Dataset) else xr.open_dataset(outfile,use_cftime = True)
     models = list(dsWi['delta_q'].member.data)
     # All keyword arguments for CMIP5 and CMIP6 (add here)
     plot_kwargs = {
@@ -0,0 +1,80 @@
+#################################
+# packages
+#################################
+
+import numpy as np
+
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+
+##################################################################
+# persistent store of selection results
+##################################################################
+
+# Results are kept in an SQLite file, one row per grid point, under a hash of the metrics
+# (see function.metrics_digest) and of all options that change the selection. Several processes
+# may read and write the same file: every access opens its own connection and writes are single
+# transactions (INSERT OR REPLACE). SQLite's default rollback journal is kept (its write-ahead log
+# needs shared memory, which network filesystems lack), so the file may be on a shared filesystem
+# whose file locks work; a reader waits for a write to finish.
+
+# suggested file of the result store (select_models only uses one if given)
+RESULT_CACHE = 'climsips_results.sqlite'
+
+# seconds a process waits for another one's write
+TIMEOUT = 60
+
+def connect(path):
+    connection = sqlite3.connect(str(path), timeout=TIMEOUT)
+    # also turns a file created in WAL mode back to the rollback journal
+    connection.execute('PRAGMA journal_mode=DELETE')
+    connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT NOT NULL)')
+    return connection
+
+# key of one selection: the metrics digest and the options, e.g. m, alpha, beta, perf_cutoff, solver
+def result_key(digest, **options):
+    return hashlib.sha256(repr((digest, sorted(options.items()))).encode()).hexdigest()
+
+# a result of single_run, (min_val, members) or, in ranked mode, (vals, [members, ...]), as json
+def encode(result):
+    vals, members = result
+    if np.ndim(vals):
+        return json.dumps(dict(vals=[float(val) for val in vals], members=[[str(member) for member in subset] for subset in members]))
+    return json.dumps(dict(val=float(vals), members=[str(member) for member in members]))
+
+def decode(text):
+    result = json.loads(text)
+    if 'vals' in result:
+        return np.array(result['vals'], dtype=np.float64), result['members']
+    return np.float64(result['val']), result['members']
+
+# stored results of the given keys, {key: result} (keys without a result are left out)
+def lookup(path, keys):
+    if path is None or not Path(path).exists():
+        return {}
+    keys = list(keys)
+    found = {}
+    connection = connect(path)
+    try:
+        # in chunks below SQLite's limit of host parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start+500]
+            rows = connection.execute(f"SELECT key, result FROM results WHERE key IN ({','.join('?'*len(chunk))})", chunk)
+            found.update((key, decode(text)) for key, text in rows)
+    finally:
+        connection.close()
+    return found
+
+# stores {key: result} in one transaction
+def store(path, results):
+    if path is None or not results:
+        return
+    connection = connect(path)
+    try:
+        with connection:
+            connection.executemany('INSERT OR REPLACE INTO results (key, result) VALUES (?, ?)',
+                                   [(key, encode(result)) for key, result in results.items()])
+    finally:
+        connection.close()
@@ -0,0 +1,107 @@
+#################################
+# packages
+#################################
+
+import xarray as xr
+import numpy as np
+
+import time
+from collections import Counter
+
+from . import enumeration as csen
+from . import function as csf
+
+##################################################################
+# robustness of the selection to resampled inputs
+##################################################################
+
+# The selection is repeated for B replicates of the performance, independence and spread inputs.
+# All replicates share the members with perf < perf_cutoff in the original data, so a single
+# enumeration (csen.best_subsets_batch) scores every block of combinations for all of them.
+# How often each member and each subset is selected measures how robust the selection is.
+
+# replicates of the normalized matrices (each of shape (B, n, n)) of the members with perf < perf_cutoff:
+# 'bootstrap' draws n members with replacement, the normalization statistics are those of the drawn
+#             ensemble and members that were not drawn cannot be selected (available False),
+# 'perturb' adds normal noise with standard deviation sigma to delta_q (e.g. its observational
+#           uncertainty) before normalizing
+# returns members, norm_perf, norm_dist, norm_change and available (B, n)
+def replicate_norms(data, perf_cutoff, replicates=100, method='bootstrap', sigma=None, seed=0):
+    perf, dist, change = csf.metric_arrays(data)
+    members = list(perf.member.data[perf.data < perf_cutoff])
+    n = len(members)
+    perf = perf.sel(member=members).data
+    dist = dist.sel(member=members, member_model=members).data
+    change = change.sel(member=members, member_model=members).data
+    if method == 'perturb' and sigma is None:
+        raise ValueError("method 'perturb' needs the standard deviation sigma of delta_q")
+
+    rng = np.random.default_rng(seed)
+    norms = []
+    available = np.ones((replicates, n), dtype=bool)
+    for replicate in range(replicates):
+        if method == 'bootstrap':
+            sample = rng.integers(n, size=n)
+            available[replicate] = np.bincount(sample, minlength=n) > 0
+            norms.append(csf.normalize(perf, dist, change, sample=sample))
+        elif method == 'perturb':
+            norms.append(csf.normalize(perf + sigma * rng.standard_normal(n), dist, change))
+        else:
+            raise NotImplementedError(method)
+    norm_perf, norm_dist, norm_change = (np.stack(norm) for norm in zip(*norms))
+    return members, norm_perf, norm_dist, norm_change, available
+
+# best m-subsets of all replicates of replicate_norms at one alpha-beta point, and how often each
+# member and each subset is selected; returns a Dataset with
+#   selected (replicate, position), cost (replicate)  best subset of every replicate
+#   member_frequency (member)                          fraction of the replicates selecting the member
+#   subset_members (subset, position),
+#   subset_frequency (subset)                          distinct subsets, the most frequent first
+#   reference (position), reference_frequency          selection of the original inputs (enumerated in
+#                                                      the same batch) and how often the replicates agree
+# replicates whose bootstrap sample has fewer than m members select nothing and are not counted
+def selection_frequencies(data, m, alpha, beta, perf_cutoff, replicates=100, method='bootstrap', sigma=None, seed=0, rows=None, silent=True):
+    members, norm_perf, norm_dist, norm_change, available = replicate_norms(data, perf_cutoff, replicates, method, sigma, seed)
+    costs = csen.cost_matrix(norm_perf, norm_dist, norm_change, alpha, beta)
+    # members missing from a bootstrap sample make every subset containing them infinitely expensive
+    replicate, member = np.nonzero(~available)
+    costs[replicate, member, member] = np.inf
+    # the original inputs are enumerated as one more replicate
+    reference_cost = csen.cost_matrix(*csf.norm_matrices(*csf.metric_arrays(data), perf_cutoff), alpha, beta)
+    costs = np.concatenate([costs, reference_cost[None]])
+
+    start_time = time.time()
+    def progress(done, total, bests):
+        # this part displays progress, requires silent = False
+        percent = done / total
+        eta = (1-percent) * (time.time() - start_time) / percent
+        print(f"{100*percent:>4.1f}% / eta in {eta/60:.1f} min")
+    bests = csen.best_subsets_batch(costs, m, rows=rows, progress=None if silent else progress)
+    reference = [members[i] for i in bests[-1].combos[0]]
+
+    selected = np.full((replicates, m), '', dtype=object)
+    cost = np.full(replicates, np.inf)
+    subsets = Counter()
+    for replicate, best in enumerate(bests[:-1]):
+        if np.isfinite(best.vals[0]):
+            selected[replicate] = [members[i] for i in best.combos[0]]
+            cost[replicate] = best.vals[0]
+            subsets[tuple(selected[replicate])] += 1
+    counted = max(1, int(np.isfinite(cost).sum()))
+    member_frequency = [np.sum(selected == member) / counted for member in members]
+    subset_list = subsets.most_common()
+
+    if not silent:
+        print(f"{counted} of {replicates} replicates, reference {', '.join(reference)} selected by {subsets[tuple(reference)] / counted:.2f}")
+        for subset, count in subset_list[:10]:
+            print(f"{count / counted:.2f} {', '.join(subset)}")
+
+    return xr.Dataset(dict(selected=(['replicate', 'position'], selected),
+                           cost=(['replicate'], cost),
+                           member_frequency=(['member'], member_frequency),
+                           subset_members=(['subset', 'position'], np.array([subset for subset, count in subset_list], dtype=object).reshape(-1, m)),
+                           subset_frequency=(['subset'], [count / counted for subset, count in subset_list]),
+                           reference=(['position'], np.array(reference, dtype=object)),
+                           reference_frequency=subsets[tuple(reference)] / counted),
+                      coords=dict(member=members),
+                      attrs=dict(m=m, alpha=alpha, beta=beta, perf_cutoff=perf_cutoff, method=method, seed=seed))
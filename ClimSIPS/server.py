@@ -0,0 +1,239 @@
+#################################
+# packages
+#################################
+
+import xarray as xr
+import numpy as np
+
+import os
+import math
+import sys
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+import socketserver
+from pathlib import Path
+from concurrent.futures import Future, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from . import function as csf
+from . import hull_index as csh
+
+##################################################################
+# local selection server
+##################################################################
+
+# A long-running process that loads the metrics files once and answers selection queries over
+# HTTP (TCP or a Unix socket):
+#   GET /select?m=4&alpha=0.3&beta=0.4[&file=...&perf_cutoff=10&solver=auto&top_k=..&epsilon=..
+#                                       &min2=0&time_budget=..]
+#   GET /files
+# The metrics, their normalized matrices (function.norm_matrices) and the hull indexes stay in
+# memory. Queries wait in a bounded queue for one of the worker threads; a query that finds the
+# queue full is refused (503), one that is not answered within its time budget gets 504. The time
+# budget is a deadline of the search itself (see function.get_best_m_models): the worker stops it
+# between two blocks and moves on, and a query still queued at its deadline is not started, so an
+# expensive query cannot hold a worker. Solver 'auto' anneals for the time budget where the
+# enumeration would not fit in it (ENUMERATION_RATE). Every answer carries the lower bound on the
+# minimum cost and the gap of its best subset (see bounds.py).
+
+# default seconds a query may take (solver 'anneal', and 'auto' where it anneals, use it as budget)
+TIME_BUDGET = 10.
+
+# seconds a query waits for its result beyond its time budget (queueing, rescoring, replies)
+GRACE = 1.
+
+# cost matrix entries summed per second by an enumeration (m*m per subset, solver 'numpy'), a
+# conservative estimate for routing solver 'auto'
+ENUMERATION_RATE = 5e7
+
+# a number of a query, integral values as int (perf_cutoff=10 names the same hull index and
+# result_cache entries as in select_models)
+def number(text):
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+# a float of a reply, None where it is not finite (strict json has no inf and nan)
+def finite(value):
+    return float(value) if value is not None and np.isfinite(value) else None
+
+class SelectionServer:
+    # files: metrics files (perf_ind_spread_metrics), queried by their stem (or as the only file)
+    # hull: subset sizes m whose hull indexes (see make_hull_index) are loaded or built at startup;
+    #       plain minimum queries of these m are hull lookups (any alpha and beta, microseconds)
+    def __init__(self, files, perf_cutoff=10, workers=2, queue_size=64, time_budget=TIME_BUDGET, hull=(), result_cache=None):
+        self.perf_cutoff = number(perf_cutoff)
+        self.time_budget = time_budget
+        self.result_cache = result_cache
+        self.files = {}
+        self.data = {}
+        for outfile in files:
+            with xr.open_dataset(outfile, use_cftime=True) as data:
+                self.data[Path(outfile).stem] = data.load()
+            self.files[Path(outfile).stem] = outfile
+            # normalizes once, later queries find the matrices in the norm_matrices cache
+            csf.norm_matrices(*csf.metric_arrays(self.data[Path(outfile).stem]), self.perf_cutoff)
+        self.hull = {}
+        for name, outfile in self.files.items():
+            for m in hull:
+                self.hull[(name, m, self.perf_cutoff)] = csh.hull_lookup(csf.get_hull_index(outfile, m, self.perf_cutoff))
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.workers = [threading.Thread(target=self.work, daemon=True) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def work(self):
+        while True:
+            future, query, deadline = self.queue.get()
+            if future.set_running_or_notify_cancel():
+                try:
+                    if time.time() > deadline:
+                        raise csf.SearchTimeout('the query passed its deadline in the queue')
+                    future.set_result(self.answer(query, deadline))
+                except Exception as error:
+                    future.set_exception(error)
+            self.queue.task_done()
+
+    # queues the query; returns the answer, raises queue.Full or TimeoutError
+    def submit(self, query):
+        future = Future()
+        time_budget = float(query.get('time_budget', self.time_budget))
+        if not 0 < time_budget < math.inf:
+            raise ValueError('time_budget must be a positive number of seconds')
+        self.queue.put_nowait((future, query, time.time() + time_budget))
+        return future.result(timeout=time_budget + GRACE)
+
+    # the selection of one query (a dict of strings as parsed from the url), searched until deadline
+    def answer(self, query, deadline=None):
+        start = time.time()
+        if 'file' in query:
+            name = query['file']
+        elif len(self.data) == 1:
+            name = next(iter(self.data))
+        else:
+            raise ValueError(f'several files are loaded, select one of {list(self.data)}')
+        if name not in self.data:
+            raise ValueError(f'unknown file {name}, loaded are {list(self.data)}')
+        m = int(query['m'])
+        alpha, beta = number(query['alpha']), number(query['beta'])
+        perf_cutoff = number(query['perf_cutoff']) if 'perf_cutoff' in query else self.perf_cutoff
+        min2 = query.get('min2', '0').lower() in ['1', 'true']
+        top_k = int(query['top_k']) if 'top_k' in query else None
+        epsilon = float(query['epsilon']) if 'epsilon' in query else None
+        solver = query.get('solver', 'auto')
+        time_budget = float(query.get('time_budget', self.time_budget))
+        # also refuses nan
+        if not (alpha >= 0 and beta >= 0 and alpha + beta <= 1):
+            raise ValueError('alpha and beta must be non-negative with alpha + beta <= 1')
+        if not perf_cutoff > -math.inf:
+            raise ValueError('perf_cutoff must be a number')
+        n = int((self.data[name].delta_q.data < perf_cutoff).sum())
+        if not 1 <= m <= n:
+            raise ValueError(f'm must be between 1 and the {n} members with perf < {perf_cutoff}')
+
+        lookup = self.hull.get((name, m, perf_cutoff))
+        info = {}
+        if lookup is not None and solver in ['auto', 'hull'] and not min2 and top_k is None and epsilon is None:
+            solver = 'hull'
+            result = csh.hull_single_run(lookup, alpha, beta)
+            info = dict(bound=float(result[0]), gap=0.)
+        elif solver == 'hull':
+            raise ValueError(f'no hull index of m={m}, perf_cutoff={perf_cutoff} (server option --hull), or min2/top_k/epsilon given')
+        else:
+            if solver == 'auto':
+                if math.comb(n, m) * m * m > time_budget * ENUMERATION_RATE:
+                    solver = 'anneal'
+            result = csf.single_run(m, alpha, beta, perf_cutoff, self.data[name], silent=True, min2=min2, solver=solver,
+                                    top_k=top_k, epsilon=epsilon, time_budget=time_budget, result_cache=self.result_cache, info=info, deadline=deadline)
+        vals, members = result
+        if np.ndim(vals):
+            cost, members = [finite(val) for val in vals], [[str(member) for member in subset] for subset in members]
+        else:
+            cost, members = finite(vals), [str(member) for member in members]
+        return dict(file=name, m=m, alpha=alpha, beta=beta, perf_cutoff=perf_cutoff, solver=solver,
+                    cost=cost, members=members, bound=finite(info.get('bound')), gap=finite(info.get('gap')), seconds=time.time()-start)
+
+class SelectionHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        selection = self.server.selection
+        if url.path == '/files':
+            return self.reply(200, dict(files=list(selection.data), hull=[list(key) for key in selection.hull]))
+        if url.path != '/select':
+            return self.reply(404, dict(error=f'unknown path {url.path}, use /select or /files'))
+        try:
+            self.reply(200, selection.submit(query))
+        except queue.Full:
+            self.reply(503, dict(error='the query queue is full'))
+        except (TimeoutError, csf.SearchTimeout):
+            self.reply(504, dict(error='the query exceeded its time budget'))
+        except (KeyError, ValueError, NotImplementedError) as error:
+            self.reply(400, dict(error=f'{type(error).__name__}: {error}'))
+        except Exception as error:
+            self.reply(500, dict(error=f'{type(error).__name__}: {error}'))
+
+    def reply(self, status, body):
+        text = json.dumps(body, allow_nan=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    # unix socket clients have no address
+    def address_string(self):
+        return self.client_address[0] if self.client_address else 'unix'
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+# serves the selection server on host:port, or on the Unix socket path if given, until interrupted
+def serve(selection, host='127.0.0.1', port=8765, path=None):
+    if path is not None:
+        if os.path.exists(path):
+            os.unlink(path)
+        httpd = UnixHTTPServer(path, SelectionHandler)
+    else:
+        httpd = ThreadingHTTPServer((host, port), SelectionHandler)
+    httpd.selection = selection
+    print(f"serving {', '.join(selection.data)} on {path or f'http://{host}:{port}'}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        if path is not None and os.path.exists(path):
+            os.unlink(path)
+
+# python -m ClimSIPS.server perf_ind_spread_metrics.nc [...] [--port 8765 | --socket PATH]
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='local ClimSIPS selection server')
+    parser.add_argument('files', nargs='+', help='perf_ind_spread_metrics files')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', default=None, help='serve on this Unix socket instead of TCP')
+    parser.add_argument('--perf-cutoff', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--queue-size', type=int, default=64)
+    parser.add_argument('--time-budget', type=float, default=TIME_BUDGET)
+    parser.add_argument('--hull', default='', help='comma-separated m with resident hull indexes')
+    parser.add_argument('--result-cache', default=None)
+    args = parser.parse_args(argv)
+    hull = [int(m) for m in args.hull.split(',') if m.strip()]
+    selection = SelectionServer(args.files, perf_cutoff=args.perf_cutoff, workers=args.workers, queue_size=args.queue_size,
+                                time_budget=args.time_budget, hull=hull, result_cache=args.result_cache)
+    serve(selection, args.host, args.port, args.socket)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,390 @@
+#################################
+# packages
+#################################
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import milp, LinearConstraint, Bounds
+
+import math
+import time
+
+from . import enumeration as csen
+
+##################################################################
+# alternatives to the exhaustive subset search
+##################################################################
+
+# All solvers minimize the cost of a subset S of size m, sum_{i,j in S} cost[i, j], for the cost
+# matrix of get_best_m_models (normalized performance on the diagonal, weighted independence
+# and spread off the diagonal). They return a csen.BestSubsets holding exactly scored subsets.
+
+# relative size of the rounding differences between incrementally and exactly summed costs
+# (one definition for all searches, see enumeration.py)
+SLACK = csen.SLACK
+cost_scale = csen.cost_scale
+
+# exactly scores the given combinations and offers them (with their lexicographic ranks)
+def offer_exact(best, cost, combos):
+    n = len(cost)
+    combos = np.asarray(combos, dtype=np.intp).reshape(-1, best.m)
+    best.offer(csen.score_combinations(cost, combos), csen.combination_rank_array(combos, n), combos)
+
+# builds a subset by adding the member with the lowest marginal cost, one at a time
+# (starting from the members in start, e.g. the optimum of a smaller subset size)
+def greedy_subset(cost, m, start=()):
+    pair = cost + cost.T
+    chosen = list(start)
+    marginal = np.diag(cost) + pair[chosen].sum(axis=0)
+    for _ in range(m-len(chosen)):
+        marginal_free = marginal.copy()
+        marginal_free[chosen] = np.inf
+        j = int(np.argmin(marginal_free))
+        chosen.append(j)
+        marginal += pair[j]
+    return sorted(chosen)
+
+################################
+# branch and bound
+################################
+
+# Partial subsets are extended in lexicographic order. For a partial subset S with the
+# remaining r members to be chosen from the candidates J (all indices above the last one in S),
+#   cost(S + T) = cost(S) + sum_{j in T} (cost[j, j] + g[j]) + 1/2 sum_{j != k in T} pair[j, k]
+# with g[j] = sum_{i in S} pair[i, j] and pair = cost + cost.T. Each j in T pairs with r-1
+# others from J, so half the sum of its r-1 smallest pair terms in J bounds its share of the
+# last term from below, and the sum of the r smallest per-member bounds is an admissible bound.
+
+# half the sum of the r-1 smallest pair terms of every j among the candidates j, k >= start;
+# pair_bounds[start][r][j-start]
+def pair_bounds(pair, m):
+    n = len(pair)
+    bounds = []
+    for start in range(n+1):
+        sub = pair[start:, start:].copy()
+        np.fill_diagonal(sub, np.inf)
+        sub.sort(axis=1)
+        cumulative = np.cumsum(sub, axis=1)
+        per_r = [np.zeros(n-start), np.zeros(n-start)]
+        for r in range(2, m+1):
+            if r-2 < n-start-1:
+                per_r.append(0.5*cumulative[:, r-2])
+            else:
+                per_r.append(np.full(n-start, np.inf))
+        bounds.append(per_r)
+    return bounds
+
+# exact branch and bound search for the k best subsets (or those within epsilon of the best);
+# incumbent (a sorted index combination, e.g. the optimum of a neighbouring alpha-beta point)
+# seeds the pruning threshold
+def branch_and_bound(cost, m, k=1, epsilon=None, incumbent=None, leaf_size=2**14, progress=None):
+    cost = np.ascontiguousarray(cost, dtype=np.float64)
+    n = len(cost)
+    best = csen.BestSubsets(m, k, epsilon=epsilon)
+    if m > n:
+        return best
+    slack = SLACK * cost_scale(cost, m)
+    pair = cost + cost.T
+    diag = np.diag(cost).copy()
+    bounds = pair_bounds(pair, m)
+
+    offer_exact(best, cost, [greedy_subset(cost, m)])
+    if incumbent is not None:
+        offer_exact(best, cost, [incumbent])
+
+    nodes = [0]
+    start_time = time.time()
+
+    def leaves(chosen, base, g, start, r):
+        # all completions of a small subproblem at once
+        cand = np.arange(start, n)
+        local = cost[np.ix_(cand, cand)].copy()
+        local[np.diag_indices_from(local)] += g[cand]
+        for _, block in csen.combination_blocks(len(cand), r, rows=leaf_size):
+            approx = base + csen.score_combinations(local, block)
+            hits = approx <= best.threshold() + slack
+            if hits.any():
+                tails = cand[block[hits]]
+                combos = np.hstack([np.broadcast_to(chosen, (len(tails), len(chosen))), tails])
+                offer_exact(best, cost, combos)
+
+    def search(chosen, base, g, start):
+        nodes[0] += 1
+        r = m - len(chosen)
+        if r == 0:
+            offer_exact(best, cost, [chosen])
+            return
+        if n - start < r:
+            return
+        # lower bound over all completions
+        h = diag[start:] + g[start:] + bounds[start][r]
+        lowest = np.sort(h)[:r]
+        if base + lowest.sum() > best.threshold() + slack:
+            return
+        if math.comb(n-start, r) <= leaf_size:
+            leaves(np.array(chosen, dtype=np.intp), base, g, start, r)
+            return
+        # bound of the completions containing j: h[j] plus the r-1 smallest others
+        child_bounds = base + np.maximum(lowest.sum(), h + lowest[:r-1].sum())
+        for j in range(start, n-r+1):
+            if child_bounds[j-start] > best.threshold() + slack:
+                continue
+            search(chosen + [j], base + diag[j] + g[j], g + pair[j], j+1)
+        if progress is not None and nodes[0] & 0b1111111111 == 0:
+            progress(nodes[0], time.time() - start_time, best)
+
+    search([], 0., np.zeros(n), 0)
+    return best
+
+################################
+# mixed-integer linear program
+################################
+
+# The quadratic selection problem min x^T cost x, sum(x) = m, x binary, is linearized with one
+# continuous y[p] in [0, 1] per member pair p = (i, j), i < j, standing for x[i] * x[j]:
+#   min sum_i cost[i, i] x[i] + sum_p pair[i, j] y[p]
+#   y[p] <= x[i], y[p] <= x[j], sum_{j != i} y[(i, j)] = (m-1) x[i], sum_i x[i] = m
+# The equality rows force y[p] = x[i] * x[j] for binary x and tighten the LP relaxation.
+
+def milp_model(cost, m):
+    n = len(cost)
+    pair = cost + cost.T
+    iu, ju = np.triu_indices(n, k=1)
+    npair = len(iu)
+    objective = np.concatenate([np.diag(cost), pair[iu, ju]])
+    p = np.arange(npair)
+
+    # y[p] - x[i] <= 0 and y[p] - x[j] <= 0
+    rows = np.concatenate([p, p, npair + p, npair + p])
+    cols = np.concatenate([n + p, iu, n + p, ju])
+    vals = np.concatenate([np.ones(npair), -np.ones(npair), np.ones(npair), -np.ones(npair)])
+    upper_pairs = LinearConstraint(sparse.csr_array((vals, (rows, cols)), shape=(2*npair, n+npair)), -np.inf, 0)
+
+    # sum_{j != i} y[(i, j)] - (m-1) x[i] = 0
+    rows = np.concatenate([iu, ju, np.arange(n)])
+    cols = np.concatenate([n + p, n + p, np.arange(n)])
+    vals = np.concatenate([np.ones(2*npair), np.full(n, -(m-1.))])
+    degree = LinearConstraint(sparse.csr_array((vals, (rows, cols)), shape=(n, n+npair)), 0, 0)
+
+    size = LinearConstraint(np.concatenate([np.ones(n), np.zeros(npair)])[None, :], m, m)
+    integrality = np.concatenate([np.ones(n), np.zeros(npair)])
+    return objective, [upper_pairs, degree, size], integrality
+
+# k best subsets (or those within epsilon of the best) with scipy's HiGHS MILP solver, the next
+# best is found by excluding the previous solutions with a cut; info receives the optimality gap
+# and dual bound of the (last) solve; member constraints (csen.Constraints) become variable bounds
+# and one row per family
+def milp_subsets(cost, m, k=1, epsilon=None, time_limit=None, info=None, member_constraints=None):
+    cost = np.ascontiguousarray(cost, dtype=np.float64)
+    n = len(cost)
+    best = csen.BestSubsets(m, k, epsilon=epsilon)
+    objective, constraints, integrality = milp_model(cost, m)
+    lower, upper = np.zeros(len(objective)), np.ones(len(objective))
+    if member_constraints is not None:
+        lower[list(member_constraints.include)] = 1
+        upper[list(member_constraints.exclude)] = 0
+        if member_constraints.families is not None and member_constraints.max_per_family is not None:
+            _, family = np.unique(member_constraints.families, return_inverse=True)
+            rows = np.zeros((family.max()+1, len(objective)))
+            rows[family, np.arange(n)] = 1
+            constraints = constraints + [LinearConstraint(rows, -np.inf, member_constraints.max_per_family)]
+    bounds = Bounds(lower, upper)
+    options = dict(mip_rel_gap=0)
+    if time_limit is not None:
+        options['time_limit'] = time_limit
+    gaps = []
+    while k is None or len(gaps) < k:
+        res = milp(objective, constraints=constraints, integrality=integrality, bounds=bounds, options=options)
+        if res.x is None:
+            break
+        combo = np.flatnonzero(res.x[:n] > 0.5)
+        if epsilon is not None and len(best) and res.fun > best.vals[0] + epsilon + SLACK * cost_scale(cost, m):
+            break
+        offer_exact(best, cost, [combo])
+        gaps.append(res.mip_gap)
+        if info is not None:
+            info['status'] = res.message
+            info['bound'] = res.mip_dual_bound
+        # no-good cut: at most m-1 members of this subset
+        cut = np.zeros(len(objective))
+        cut[combo] = 1
+        constraints = constraints + [LinearConstraint(cut[None, :], -np.inf, m-1)]
+    if info is not None:
+        info['gap'] = max(gaps) if gaps else np.inf
+    return best
+
+################################
+# simulated annealing
+################################
+
+# A state is a subset S of size m; a move swaps a member a in S for a member b outside it, with
+#   delta = cost[b, b] - cost[a, a] + g[b] - pair[a, b] - g[a],   g[j] = sum_{i in S, i != j} pair[i, j]
+# evaluated in O(1) from g, which is updated in O(n) when a move is accepted. The temperature
+# decreases geometrically over the time budget, so the search ends greedy.
+
+# moves between two checks of the clock (and exact re-scorings of the current state)
+ANNEAL_CHECK = 2000
+
+# subsets found by simulated annealing within time_budget seconds: the k best (or those within
+# epsilon of the best) of all visited states, exactly scored. The search starts from incumbent
+# (a sorted index combination) or the greedy subset; trace receives (seconds, moves, best cost)
+# whenever the best state improves, progress(moves, elapsed, best) is called at every clock check.
+# Without proof of optimality; the result of a fixed seed depends on the machine speed.
+def simulated_annealing(cost, m, k=1, epsilon=None, time_budget=10., incumbent=None, seed=0,
+                        trace=None, progress=None):
+    cost = np.ascontiguousarray(cost, dtype=np.float64)
+    n = len(cost)
+    slack = SLACK * cost_scale(cost, m)
+    candidates = csen.BestSubsets(m, k, slack=slack, epsilon=epsilon)
+    if m > n:
+        return candidates.rescored(cost)
+    rng = np.random.default_rng(seed)
+    pair = cost + cost.T
+    np.fill_diagonal(pair, 0)
+    diag = np.diag(cost).copy()
+
+    state = list(incumbent) if incumbent is not None else greedy_subset(cost, m)
+    inside = np.zeros(n, dtype=bool)
+    inside[state] = True
+    outside = list(np.flatnonzero(~inside))
+    g = pair[state].sum(axis=0)
+    value = csen.score_combinations(cost, np.array([sorted(state)]))[0]
+
+    def visit(value):
+        if value <= candidates.threshold():
+            combo = np.array(sorted(state), dtype=np.intp)
+            candidates.offer(np.array([value]), csen.combination_rank_array(combo[None, :], n), combo[None, :])
+
+    visit(value)
+    best_value = value
+    if trace is not None:
+        trace.append((0., 0, float(best_value)))
+    if not outside or m == 0:
+        return candidates.rescored(cost)
+
+    # initial temperature: spread of the cost change of random moves
+    deltas = [diag[b] - diag[a] + g[b] - pair[a, b] - g[a]
+              for a, b in zip(rng.choice(state, 100), rng.choice(outside, 100))]
+    start_temperature = max(np.std(deltas), 1e-12)
+    end_temperature = 1e-4 * start_temperature
+
+    start_time = time.time()
+    moves = 0
+    temperature = start_temperature
+    while True:
+        ins = rng.integers(m, size=ANNEAL_CHECK)
+        outs = rng.integers(len(outside), size=ANNEAL_CHECK)
+        accept = np.log(rng.random(ANNEAL_CHECK))
+        for i, o, u in zip(ins, outs, accept):
+            a, b = state[i], outside[o]
+            delta = diag[b] - diag[a] + g[b] - pair[a, b] - g[a]
+            if delta <= 0 or u < -delta / temperature:
+                state[i], outside[o] = b, a
+                g += pair[b] - pair[a]
+                value += delta
+                visit(value)
+                if value < best_value:
+                    best_value = value
+                    if trace is not None:
+                        trace.append((time.time() - start_time, moves, float(best_value)))
+            moves += 1
+        # re-scoring the current state keeps the incremental costs from drifting
+        value = csen.score_combinations(cost, np.array([sorted(state)]))[0]
+        elapsed = time.time() - start_time
+        if progress is not None:
+            progress(moves, elapsed, candidates)
+        if elapsed >= time_budget:
+            break
+        temperature = start_temperature * (end_temperature / start_temperature)**(elapsed / time_budget)
+    return candidates.rescored(cost)
+
+################################
+# greedy construction and swap local search
+################################
+
+# From the greedy subset, every step takes the best 1-swap (a in S for b outside, all m (n-m)
+# deltas at once from g as in simulated_annealing); when no 1-swap improves, the best 2-swap
+#   delta(a1, b1) + delta(a2, b2) + pair[a1, a2] + pair[b1, b2] - pair[a1, b2] - pair[a2, b1]
+# is tried with the first swap from a candidate list (the SWAP_CANDIDATES best 1-swaps of every
+# member), so a 1-swap step costs O(m n) and a 2-swap step O(SWAP_CANDIDATES m^2 n), not
+# O(m^2 n^2) for all pairs of 1-swaps. At a local optimum the search moves on with the best
+# non-improving 1-swap, and members swapped out may not return for tabu_tenure steps (unless that
+# beats the best subset); it stops after patience such steps without improvement. Fully deterministic.
+
+# 1-swaps per member that start a 2-swap
+SWAP_CANDIDATES = 4
+
+# k best (or within epsilon of the best) subsets among those visited by the swap local search,
+# exactly scored; incumbent (a sorted index combination) replaces the greedy start if given
+def local_search(cost, m, k=1, epsilon=None, incumbent=None, tabu_tenure=None, patience=None, max_moves=10000, swap_candidates=SWAP_CANDIDATES):
+    cost = np.ascontiguousarray(cost, dtype=np.float64)
+    n = len(cost)
+    slack = SLACK * cost_scale(cost, m)
+    candidates = csen.BestSubsets(m, k, slack=slack, epsilon=epsilon)
+    if m > n:
+        return candidates.rescored(cost)
+    if tabu_tenure is None:
+        tabu_tenure = max(1, min(m, n-m) // 2)
+    if patience is None:
+        patience = m
+    pair = cost + cost.T
+    np.fill_diagonal(pair, 0)
+    diag = np.diag(cost)
+
+    state = np.array(sorted(incumbent) if incumbent is not None else greedy_subset(cost, m), dtype=np.intp)
+
+    def score(state):
+        return csen.score_combinations(cost, np.sort(state)[None, :])[0]
+
+    def visit(state, value):
+        if value <= candidates.threshold():
+            combo = np.sort(state)
+            candidates.offer(np.array([value]), csen.combination_rank_array(combo[None, :], n), combo[None, :])
+
+    value = score(state)
+    visit(state, value)
+    best_value = value
+    tabu_until = np.zeros(n, dtype=np.int64)
+    stale = 0
+    for move in range(max_moves):
+        inside = np.zeros(n, dtype=bool)
+        inside[state] = True
+        outside = np.flatnonzero(~inside)
+        if len(outside) == 0 or m == 0:
+            break
+        g = pair[state].sum(axis=0)
+        # delta[i, o]: swap state[i] out, outside[o] in
+        delta = (diag[outside] + g[outside])[None, :] - (diag[state] + g[state])[:, None] - pair[np.ix_(state, outside)]
+        allowed = (tabu_until[outside] <= move)[None, :] | (value + delta < best_value - slack)
+        delta_allowed = np.where(allowed, delta, np.inf)
+        i, o = np.unravel_index(np.argmin(delta_allowed), delta.shape)
+        swap = [(i, o)]
+        if delta_allowed[i, o] >= -slack and m > 1 and len(outside) > 1:
+            # 2-swaps of a candidate 1-swap p = (i1, o1) and any (i2, o2) with i2 != i1 and o2 != o1
+            c = min(swap_candidates, len(outside))
+            ci = np.repeat(np.arange(len(state)), c)
+            co = np.argpartition(delta, c-1, axis=1)[:, :c].reshape(-1)
+            a, b = state[ci], outside[co]
+            delta2 = (delta[ci, co][:, None, None] + delta[None, :, :] + pair[np.ix_(a, state)][:, :, None] + pair[np.ix_(b, outside)][:, None, :]
+                      - pair[np.ix_(a, outside)][:, None, :] - pair[np.ix_(b, state)][:, :, None])
+            delta2[np.arange(len(ci)), ci, :] = np.inf
+            delta2[np.arange(len(ci)), :, co] = np.inf
+            p, i2, o2 = np.unravel_index(np.argmin(delta2), delta2.shape)
+            if delta2[p, i2, o2] < -slack:
+                swap = [(ci[p], co[p]), (i2, o2)]
+        if len(swap) == 1 and not np.isfinite(delta_allowed[i, o]):
+            break
+        removed = [state[i] for i, o in swap]
+        for i, o in swap:
+            state[i] = outside[o]
+        tabu_until[removed] = move + 1 + tabu_tenure
+        value = score(state)
+        visit(state, value)
+        if value < best_value - slack:
+            best_value = value
+            stale = 0
+        else:
+            stale += 1
+            if stale > patience:
+                break
+    return candidates.rescored(cost)
@@ -45,12 +45,37 @@ def main():
     double_norm = config.getboolean('double_norm',fallback=False)
 
     # convert subselection inputs in the config to integers
-    m = config.getint('m')
+    m = config.getint('m',fallback=None)
+    # m_range = 2-8 (or 2,3,5) selects the subsets of several sizes in one run instead of m
+    m_range = config.get('m_range',fallback=None)
+    if m_range is not None:
+        if '-' in m_range:
+            first, last = m_range.split('-')
+            m_range = list(range(int(first), int(last)+1))
+        else:
+            m_range = [int(size) for size in m_range.split(',')]
     alpha = config.getint('alpha_steps',fallback=10)
     beta = config.getint('beta_steps',fallback=10)
     perf_cutoff = config.getint('perf_cutoff',fallback=10)
     max_workers = config.getint('max_workers',fallback=1)
+    parallel = config.get('parallel',fallback='grid')
+    checkpoint_dir = config.get('checkpoint_dir',fallback=None)
+    pareto_front = config.getboolean('pareto_front',fallback=False)
+    journal = config.getboolean('journal',fallback=False)
+    result_cache = config.get('result_cache',fallback=None)
+    if result_cache is not None and result_cache.lower() == 'none':
+        result_cache = None
+    time_budget = config.getfloat('time_budget',fallback=None)
+    precision = config.get('precision',fallback='float64')
     min2 = config.getboolean('min2')
+    solver = config.get('solver',fallback='numpy')
+    scan = config.get('scan',fallback='pointwise')
+    top_k = config.getint('top_k',fallback=None)
+    epsilon = config.getfloat('epsilon',fallback=None)
+    constraints = dict(max_per_family=config.getint('max_per_family',fallback=None),
+                       include=[member.strip() for member in config.get('include',fallback='').split(',') if member.strip()],
+                       exclude=[member.strip() for member in config.get('exclude',fallback='').split(',') if member.strip()])
+    constraints = {key: value for key, value in constraints.items() if value}
 
 #####################################################
 
@@ -85,9 +110,13 @@ def main():
     csp.spread_scatter(outfile,cmip,im_or_em,season_region,plotname="spread_scatter.png")
 
     # subselection
-    optimal_models_csv = csf.select_models(outfile, cmip, im_or_em, season_region, m, alpha, beta, perf_cutoff, max_workers=max_workers, min2=min2)
+    optimal_models_csv = csf.select_models(outfile, cmip, im_or_em, season_region, m, alpha, beta, perf_cutoff, max_workers=max_workers, min2=min2, solver=solver, scan=scan, top_k=top_k, epsilon=epsilon, parallel=parallel, checkpoint_dir=checkpoint_dir, time_budget=time_budget, precision=precision, constraints=constraints, m_range=m_range, result_cache=result_cache, pareto_front=pareto_front, journal=journal)
 
-    csp.selection_triangle(optimal_models_csv,alpha,plotname="optimal_subsets.png")
+    if m_range is None:
+        csp.selection_triangle(optimal_models_csv,alpha,plotname="optimal_subsets.png")
+    else:
+        for size in m_range:
+            csp.selection_triangle(optimal_models_csv,alpha,plotname=f"optimal_subsets_m{size}.png",m=size)
 
     print('---- subselection complete ----')
 
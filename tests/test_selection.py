@@ -0,0 +1,341 @@
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from ClimSIPS import function as csf
+from ClimSIPS import enumeration as csen
+from ClimSIPS import journal as csj
+from ClimSIPS import pareto as cspa
+from ClimSIPS import robustness as csr
+from ClimSIPS import server as css
+
+METRICS = Path(__file__).parents[1] / 'precomputed_predictor_outfiles' / 'perf_ind_spread_metrics_CMIP5_EM_JJA_CEU.nc'
+PERF_CUTOFF = 10
+STEPS = 3
+
+@pytest.fixture(scope='module')
+def data():
+    with xr.open_dataset(METRICS) as data:
+        return data.load()
+
+# (cost, members) of all subsets of size m at one grid point, sorted by cost (from the normalized
+# matrices without the norm_matrices cache); admissible(members) filters the subsets
+def brute_force(data, m, alpha, beta, admissible=None):
+    perf, dist, change = csf.metric_arrays(data)
+    members = list(perf.member.data[perf.data < PERF_CUTOFF])
+    cost = csen.cost_matrix(*csf.compute_norm_matrices(perf, dist, change, PERF_CUTOFF), alpha, beta)
+    subsets = [(cost[np.ix_(combo, combo)].sum(), sorted(members[i] for i in combo)) for combo in itertools.combinations(range(len(members)), m)]
+    if admissible is not None:
+        subsets = [subset for subset in subsets if admissible(subset[1])]
+    return sorted(subsets, key=lambda subset: subset[0])
+
+# metrics of n random members (of n//per_model models with per_model members each)
+def random_data(n, seed=0, per_model=2):
+    rng = np.random.default_rng(seed)
+    members = [f'model{i//per_model}-r{i%per_model+1}i1p1' for i in range(n)]
+    points = rng.normal(size=(n, 3))
+    change = np.abs(rng.normal(size=(n, n)))
+    return csf.metrics_dataset(rng.uniform(0, 5, n), np.sqrt(((points[:, None] - points[None])**2).sum(-1)), change + change.T, members)
+
+def assert_best(result, data, m, alpha, beta):
+    val, members = result
+    best_val, best_members = brute_force(data, m, alpha, beta)[0]
+    assert np.isclose(val, best_val)
+    assert sorted(map(str, members)) == best_members
+
+@pytest.mark.parametrize('m', [2, 3])
+@pytest.mark.parametrize('solver', csf.EXACT_SOLVERS)
+def test_exact_solvers(data, solver, m):
+    for alpha, beta in csf.alpha_beta_grid(STEPS, STEPS):
+        result = csf.single_run(m, alpha, beta, PERF_CUTOFF, data, silent=True, solver=solver)
+        assert_best(result, data, m, alpha, beta)
+        if solver in ['numba', 'revolving_door']:
+            # the same value as 'numpy', bit for bit
+            assert result[0] == csf.single_run(m, alpha, beta, PERF_CUTOFF, data, silent=True)[0]
+
+@pytest.mark.parametrize('m', [2, 3])
+@pytest.mark.parametrize('solver', ['numpy', 'numba'])
+def test_float32(data, solver, m):
+    for alpha, beta in csf.alpha_beta_grid(STEPS, STEPS):
+        vals, subsets = csf.single_run(m, alpha, beta, PERF_CUTOFF, data, silent=True, solver=solver, top_k=5, precision='float32')
+        vals64, subsets64 = csf.single_run(m, alpha, beta, PERF_CUTOFF, data, silent=True, solver=solver, top_k=5)
+        assert np.array_equal(vals, vals64) and subsets == subsets64
+
+def test_numba_threading_layer():
+    pytest.importorskip('numba')
+    # importing the package leaves numba's threading layer alone, the 'numba' solver sets it
+    script = ('import numba, numpy; from ClimSIPS import function, numba_kernel; layer = numba.config.THREADING_LAYER; '
+              'numba_kernel.best_subsets_numba(numpy.eye(6), 2); print(layer, numba.config.THREADING_LAYER)')
+    env = {key: value for key, value in os.environ.items() if key != 'NUMBA_THREADING_LAYER'}
+    output = subprocess.run([sys.executable, '-c', script], cwd=Path(__file__).parents[1], env=env, capture_output=True, text=True, check=True).stdout
+    assert output.split() == ['default', 'workqueue']
+
+@pytest.mark.parametrize('m', [2, 3])
+def test_ranked_and_sharded(data, m):
+    for alpha, beta in csf.alpha_beta_grid(STEPS, STEPS):
+        vals, subsets = csf.single_run(m, alpha, beta, PERF_CUTOFF, data, silent=True, top_k=4)
+        ranked = brute_force(data, m, alpha, beta)
+        assert np.allclose(vals, [val for val, _ in ranked[:4]])
+        assert [sorted(map(str, subset)) for subset in subsets] == [members for _, members in ranked[:4]]
+        val, members = csf.single_run(m, alpha, beta, PERF_CUTOFF, data, silent=True, min2=True)
+        assert np.isclose(val, ranked[1][0]) and sorted(map(str, members)) == ranked[1][1]
+        assert csf.single_run(m, alpha, beta, PERF_CUTOFF, data, silent=True, max_workers=2) == csf.single_run(m, alpha, beta, PERF_CUTOFF, data, silent=True)
+
+@pytest.mark.parametrize('m', [2, 3])
+@pytest.mark.parametrize('scan', ['pointwise', 'joint', 'hull', 'adaptive'])
+def test_scans(data, scan, m):
+    results = csf.scan_results(m, STEPS, STEPS, PERF_CUTOFF, data, scan=scan)
+    assert sorted(results) == sorted(csf.alpha_beta_grid(STEPS, STEPS))
+    for (alpha, beta), result in results.items():
+        assert_best(result, data, m, alpha, beta)
+
+def test_journal_resume(data, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = tmp_path / 'results.sqlite'
+    for scan in ['pointwise', 'joint', 'adaptive']:
+        first = csf.select_models(METRICS, 'CMIP5', 'EM', 'JJA_CEU', 3, STEPS, STEPS, PERF_CUTOFF, scan=scan, result_cache=cache, journal=True)
+        entries = len(csj.load(first).entry)
+        # resuming a completed journal solves nothing and appends nothing
+        second = csf.select_models(METRICS, 'CMIP5', 'EM', 'JJA_CEU', 3, STEPS, STEPS, PERF_CUTOFF, scan=scan, result_cache=cache, journal=True)
+        journal = csj.load(second)
+        assert len(journal.entry) == entries == len(csf.alpha_beta_grid(STEPS, STEPS))
+        for alpha, beta, cost, members in zip(journal.alpha.data, journal.beta.data, journal.cost.data, journal.members.data):
+            best_cost, best_members = brute_force(data, 3, alpha, beta)[0]
+            assert np.isclose(cost, best_cost)
+            assert sorted(map(str, members)) == best_members
+        first.unlink()
+
+def test_certificates(data):
+    selection = csf.select(data, 3, STEPS, STEPS, PERF_CUTOFF)
+    for alpha, beta in csf.alpha_beta_grid(STEPS, STEPS):
+        point = selection.sel(alpha=alpha, beta=beta)
+        assert point.bound <= brute_force(data, 3, alpha, beta)[0][0] + 1e-9
+        assert point.gap == 0
+    # the second minimum is not certified
+    selection = csf.select(data, 3, STEPS, STEPS, PERF_CUTOFF, min2=True)
+    assert np.isnan(selection.bound).all() and np.isnan(selection.gap).all()
+    info = {}
+    val, members = csf.single_run(3, 0.2, 0.3, PERF_CUTOFF, data, silent=True, min2=True, info=info)
+    assert np.isclose(val, brute_force(data, 3, 0.2, 0.3)[1][0])
+    assert 'bound' not in info
+
+# more members than a float can hold factorial(n) of
+@pytest.mark.parametrize('solver', ['milp', 'bnb', 'anneal', 'local', 'certified'])
+def test_large_pool(solver):
+    data = random_data(200)
+    best_val, best_members = csf.single_run(4, 0.3, 0.3, PERF_CUTOFF, data, silent=True, solver='bnb')
+    val, members = csf.single_run(4, 0.3, 0.3, PERF_CUTOFF, data, silent=True, solver=solver, time_budget=0.5)
+    assert len(members) == 4 and val >= best_val - 1e-9
+    if solver in csf.EXACT_SOLVERS:
+        assert np.isclose(val, best_val) and sorted(members) == sorted(best_members)
+
+# n choose m beyond int64: the heuristic solvers keep their subsets' ranks as Python ints
+@pytest.mark.parametrize('solver', ['local', 'anneal'])
+def test_ranks_beyond_int64(solver):
+    data = random_data(219)
+    vals, subsets = csf.single_run(12, 0.3, 0.3, PERF_CUTOFF, data, silent=True, solver=solver, top_k=2, time_budget=0.5)
+    assert len(subsets) == 2 and all(len(set(subset)) == 12 for subset in subsets)
+    assert vals[0] <= vals[1] and subsets[0] != subsets[1]
+
+def test_scan_file_exists(data, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    filename = csf.multi_run(2, 'CMIP5', 'EM', 'JJA_CEU', STEPS, STEPS, PERF_CUTOFF, data)
+    with pytest.raises(RuntimeError, match='file exists'):
+        csf.multi_run(2, 'CMIP5', 'EM', 'JJA_CEU', STEPS, STEPS, PERF_CUTOFF, data)
+    with pytest.raises(RuntimeError, match='file exists'):
+        csf.multi_parallel_run(2, 'CMIP5', 'EM', 'JJA_CEU', STEPS, STEPS, PERF_CUTOFF, data, 2)
+    # with a result cache the scan csv is rewritten from it
+    text = filename.read_text()
+    csf.multi_run(2, 'CMIP5', 'EM', 'JJA_CEU', STEPS, STEPS, PERF_CUTOFF, data, result_cache=tmp_path / 'results.sqlite')
+    assert csf.multi_parallel_run(2, 'CMIP5', 'EM', 'JJA_CEU', STEPS, STEPS, PERF_CUTOFF, data, 2, result_cache=tmp_path / 'results.sqlite').read_text() == text
+
+def test_search_options(data, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = tmp_path / 'results.sqlite'
+    # multi_m_run stores every grid point's results and rewrites its csv from them
+    filename = csf.multi_m_run([2, 3], 'CMIP5', 'EM', 'JJA_CEU', STEPS, STEPS, PERF_CUTOFF, data, result_cache=cache)
+    text = filename.read_text()
+    with monkeypatch.context() as patch:
+        patch.setattr(csf, 'get_best_models_m_range', None)
+        assert csf.multi_m_run([2, 3], 'CMIP5', 'EM', 'JJA_CEU', STEPS, STEPS, PERF_CUTOFF, data, result_cache=cache).read_text() == text
+    # select passes checkpoint_dir down to every grid point's search
+    checkpoints = []
+    checkpoint_file = csf.checkpoint_file
+    monkeypatch.setattr(csf, 'checkpoint_file', lambda checkpoint_dir, *args: checkpoints.append(checkpoint_dir) or checkpoint_file(checkpoint_dir, *args))
+    csf.select(data, 2, STEPS, STEPS, PERF_CUTOFF, checkpoint_dir=tmp_path)
+    assert checkpoints == [tmp_path] * len(csf.alpha_beta_grid(STEPS, STEPS))
+
+@pytest.mark.parametrize('solver', ['numpy', 'milp'])
+def test_ranking_options(data, solver):
+    for options in [dict(top_k=0), dict(top_k=-1), dict(epsilon=-0.1), dict(epsilon=np.nan)]:
+        with pytest.raises(ValueError):
+            csf.single_run(2, 0.2, 0.3, PERF_CUTOFF, data, silent=True, solver=solver, **options)
+    vals, subsets = csf.single_run(2, 0.2, 0.3, PERF_CUTOFF, data, silent=True, solver=solver, epsilon=0)
+    assert len(subsets) == 1 and np.isclose(vals[0], brute_force(data, 2, 0.2, 0.3)[0][0])
+
+# family caps and include / exclude on an IM-style pool where every model has several members
+@pytest.mark.parametrize('solver', ['numpy', 'milp'])
+def test_constraints(solver):
+    data = random_data(15, per_model=3)
+    members = list(data.member.data)
+    constraints = dict(max_per_family=2, include=[members[4]], exclude=[members[0], members[9]])
+    def admissible(subset):
+        families = [csf.get_model_base(member) for member in subset]
+        return (max(families.count(family) for family in families) <= 2 and members[4] in subset
+                and members[0] not in subset and members[9] not in subset)
+    for m in [3, 5]:
+        # the enumerator yields exactly the admissible subsets
+        limits = csf.member_constraints(members, constraints)
+        blocks = [combos for ranks, combos in csen.constrained_combination_blocks(limits, len(members), m, rows=7)]
+        enumerated = sorted(tuple(combo) for combo in np.concatenate(blocks))
+        expected = sorted(combo for combo in itertools.combinations(range(len(members)), m) if admissible([members[i] for i in combo]))
+        assert enumerated == expected and csen.constrained_count(limits, len(members), m) == len(expected)
+        for ranks, combos in csen.constrained_combination_blocks(limits, len(members), m, rows=7):
+            assert list(ranks) == [csen.combination_rank(combo, len(members)) for combo in combos]
+        for alpha, beta in csf.alpha_beta_grid(STEPS, STEPS):
+            val, subset = csf.single_run(m, alpha, beta, PERF_CUTOFF, data, silent=True, solver=solver, constraints=constraints)
+            best_val, best_members = brute_force(data, m, alpha, beta, admissible)[0]
+            assert np.isclose(val, best_val) and sorted(map(str, subset)) == best_members
+    # no admissible subset
+    val, subset = csf.single_run(2, 0.2, 0.3, PERF_CUTOFF, data, silent=True, solver=solver, constraints=dict(max_per_family=1, include=members[3:5]))
+    assert val == np.inf and subset == []
+
+class Interrupt(Exception):
+    pass
+
+# progress that interrupts an enumeration after the given number of blocks (and records the ranks done)
+def interrupt_after(blocks, done):
+    def progress(rank, total, best):
+        done.append(rank)
+        if len(done) == blocks:
+            raise Interrupt
+    return progress
+
+@pytest.mark.parametrize('k', [1, 3])
+def test_checkpoint_resume(tmp_path, k):
+    cost = np.random.default_rng(0).normal(size=(20, 20))
+    reference = csen.best_subsets(cost, 4, k=k, rows=100)
+    checkpoint = tmp_path / 'search.npz'
+    done = []
+    with pytest.raises(Interrupt):
+        csen.best_subsets(cost, 4, k=k, rows=100, progress=interrupt_after(10, done), checkpoint=checkpoint, checkpoint_interval=0)
+    assert checkpoint.exists()
+    # the restart continues after the last saved block
+    resumed = []
+    best = csen.best_subsets(cost, 4, k=k, rows=100, progress=interrupt_after(0, resumed), checkpoint=checkpoint, checkpoint_interval=0)
+    assert resumed[0] == done[-1] + 100 and resumed[-1] == csen.combination_count(20, 4)
+    assert np.array_equal(best.vals, reference.vals) and np.array_equal(best.ranks, reference.ranks)
+    assert np.array_equal(best.combos, reference.combos) and not checkpoint.exists()
+    # a checkpoint of other inputs is ignored
+    with pytest.raises(Interrupt):
+        csen.best_subsets(cost + 1, 4, k=k, rows=100, progress=interrupt_after(10, []), checkpoint=checkpoint, checkpoint_interval=0)
+    restarted = []
+    best = csen.best_subsets(cost, 4, k=k, rows=100, progress=interrupt_after(0, restarted), checkpoint=checkpoint, checkpoint_interval=0)
+    assert restarted[0] == 100
+    assert np.array_equal(best.vals, reference.vals) and np.array_equal(best.ranks, reference.ranks) and not checkpoint.exists()
+    # every shard resumes from its own checkpoint
+    shards = csen.rank_shards(20, 4, 2)
+    first, last = shards[1]
+    with pytest.raises(Interrupt):
+        csen.best_subsets(cost, 4, k=k, rows=100, progress=interrupt_after(5, []), first=first, last=last, checkpoint=f'{checkpoint}.{first}', checkpoint_interval=0)
+    best = csen.best_subsets_sharded(cost, 4, k=k, max_workers=2, rows=100, checkpoint=checkpoint, checkpoint_interval=0)
+    assert np.array_equal(best.vals, reference.vals) and np.array_equal(best.ranks, reference.ranks)
+    assert not list(tmp_path.iterdir())
+
+# rows of points not dominated by another row, by comparing all pairs
+def brute_non_dominated(points):
+    return [i for i, point in enumerate(points)
+            if not any((other <= point).all() and (other < point).any() for other in points)]
+
+# whether a weighting w = (1-alpha-beta, alpha, beta) minimizes w . points[i] (within slack): the
+# feasible (alpha, beta) form a polygon, which is not empty if one of the intersections of its edge
+# lines (or of the triangle's) is feasible
+def brute_supported(points, i, slack):
+    delta = points - points[i]
+    lines = [(d[1]-d[0], d[2]-d[0], d[0]) for d in delta] + [(1., 0., 0.), (0., 1., 0.), (-1., -1., 1.)]
+    for (a1, b1, c1), (a2, b2, c2) in itertools.combinations(lines, 2):
+        det = a1*b2 - a2*b1
+        if abs(det) < 1e-12:
+            continue
+        alpha, beta = (-c1*b2 + c2*b1) / det, (-a1*c2 + a2*c1) / det
+        if min(alpha, beta) >= -1e-9 and alpha + beta <= 1 + 1e-9 and (delta[:, 0] + alpha*(delta[:, 1]-delta[:, 0]) + beta*(delta[:, 2]-delta[:, 0]) >= -slack - 1e-9).all():
+            return True
+    return False
+
+def test_pareto():
+    rng = np.random.default_rng(0)
+    # rounded components, with many ties
+    points = np.round(rng.normal(size=(300, 3)), 1)
+    assert list(cspa.non_dominated(points)) == brute_non_dominated(points)
+    archive = cspa.ParetoArchive(1, levels=4)
+    for start in range(0, 300, 50):
+        block = points[start:start+50]
+        if len(archive):
+            # the index only flags points the archive strictly dominates
+            for point in block[archive.dominated(block)]:
+                assert any((other <= point).all() and (other < point).any() for other in archive.points)
+        archive.offer(block, np.arange(start, start+len(block)), np.arange(start, start+len(block))[:, None])
+    assert sorted(archive.ranks) == brute_non_dominated(points)
+    # the front of all subsets of a pool of rounded metrics
+    perf, dist, change = (np.round(rng.uniform(0, 3, size=(14, 14))) for _ in range(3))
+    front = cspa.build_pareto_front(perf, dist, change, 4, [f'member{i}' for i in range(14)], rows=40)
+    combos = np.array(list(itertools.combinations(range(14), 4)))
+    comps = np.stack([csen.score_combinations(a, combos) for a in (perf, dist, change)], axis=1)
+    expected = brute_non_dominated(cspa.objectives(comps))
+    assert sorted(front.combo_rank.data) == expected
+    objectives = cspa.objectives(front.components.data)
+    assert list(front.supported.data) == [brute_supported(objectives, i, 0.) for i in range(len(objectives))]
+
+@pytest.mark.parametrize('k, epsilon', [(1, None), (3, None), (None, 0.5)])
+def test_batch(k, epsilon):
+    costs = np.random.default_rng(0).normal(size=(5, 14, 14))
+    # a member missing from a bootstrap sample
+    costs[2, 3, 3] = np.inf
+    bests = csen.best_subsets_batch(costs, 3, k=k, epsilon=epsilon, rows=50)
+    for replicate, best in enumerate(bests):
+        single = csen.best_subsets(costs[replicate], 3, k=k, epsilon=epsilon)
+        assert np.array_equal(best.vals, single.vals) and np.array_equal(best.ranks, single.ranks)
+
+def test_selection_frequencies(data):
+    frequencies = csr.selection_frequencies(data, 3, 0.2, 0.3, PERF_CUTOFF, replicates=6, seed=1)
+    # the reference row is the selection of the original inputs
+    assert sorted(map(str, frequencies.reference.data)) == brute_force(data, 3, 0.2, 0.3)[0][1]
+    selected = [tuple(row) for row in frequencies.selected.data if row[0]]
+    assert frequencies.reference_frequency == selected.count(tuple(frequencies.reference.data)) / len(selected)
+    members, *norms, available = csr.replicate_norms(data, PERF_CUTOFF, replicates=6, seed=1)
+    for replicate, row in enumerate(frequencies.selected.data):
+        costs = csen.cost_matrix(*(norm[replicate] for norm in norms), 0.2, 0.3)
+        costs[~available[replicate], ~available[replicate]] = np.inf
+        assert list(row) == [members[i] for i in csen.best_subsets(costs, 3).combos[0]]
+
+def test_server_queries(data):
+    selection = css.SelectionServer([METRICS], workers=1)
+    httpd = css.ThreadingHTTPServer(('127.0.0.1', 0), css.SelectionHandler)
+    httpd.selection = selection
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    def get(query):
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{httpd.server_port}/select?{query}') as response:
+                return response.status, json.loads(response.read(), parse_constant=pytest.fail)
+        except urllib.error.HTTPError as error:
+            return error.code, json.loads(error.read(), parse_constant=pytest.fail)
+    try:
+        status, reply = get('m=3&alpha=0.2&beta=0.3&solver=numpy')
+        assert status == 200 and np.isclose(reply['cost'], brute_force(data, 3, 0.2, 0.3)[0][0]) and reply['gap'] == 0
+        for query in ['m=3&alpha=nan&beta=0.3', 'm=3&alpha=0.2&beta=inf', 'm=0&alpha=0.2&beta=0.3', 'm=27&alpha=0.2&beta=0.3',
+                      'm=3&alpha=0.2&beta=0.3&time_budget=nan', 'm=3&alpha=0.2&beta=0.3&perf_cutoff=nan', 'm=3&alpha=0.2&beta=0.3&top_k=0']:
+            status, reply = get(query)
+            assert status == 400, query
+    finally:
+        httpd.shutdown()
+        httpd.server_close()